@@ -0,0 +1,156 @@
+"""Correlations between daily activities and mood.
+
+Activity and mood records for a batch of users are laid out on one aligned
+(users x days) grid per signal, so every user in the batch is scored with
+the same handful of array operations instead of a Python loop per user.
+
+Run nightly with ``python manage.py compute-insights``.
+"""
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+# Activity signals and how they read in the app
+ACTIVITIES = {
+    "missions": "completa missões",
+    "breathing": "faz exercícios de respiração",
+    "gratitude": "registra gratidão",
+}
+
+# Lag 0 compares activity with same-day mood, lag 1 with next-day mood
+LAGS = (0, 1)
+
+# Below this many paired days a correlation is noise
+MIN_PAIRED_DAYS = 14
+
+# A correlation must reach this strength to be shown as a highlight
+HIGHLIGHT_MIN_CORRELATION = 0.2
+
+
+def build_grid(records: Iterable[Tuple[int, date, float]], num_users: int, start_day: date, num_days: int,
+               reduce: str = "sum") -> np.ndarray:
+    """Place (user_index, day, value) records on a (users x days) grid.
+
+    With reduce="sum" values on the same cell add up and empty cells are 0;
+    with reduce="last" the last value wins and empty cells are NaN.
+    """
+    records = list(records)
+    grid = np.zeros((num_users, num_days)) if reduce == "sum" else np.full((num_users, num_days), np.nan)
+    if not records:
+        return grid
+
+    users = np.fromiter((user for user, _, _ in records), dtype=np.int64, count=len(records))
+    days = np.fromiter(((day - start_day).days for _, day, _ in records), dtype=np.int64, count=len(records))
+    values = np.fromiter((value for _, _, value in records), dtype=float, count=len(records))
+
+    inside = (days >= 0) & (days < num_days)
+    users, days, values = users[inside], days[inside], values[inside]
+    if reduce == "sum":
+        np.add.at(grid, (users, days), values)
+    else:
+        grid[users, days] = values
+    return grid
+
+
+def lagged_correlations(activity: np.ndarray, mood: np.ndarray, lag: int) -> Dict[str, np.ndarray]:
+    """Per-user Pearson correlation between activity on day t and mood on day t + lag.
+
+    Days without a mood entry are left out of the pairing; days without any
+    activity count as zero activity. Returns arrays with one value per user.
+    """
+    if lag:
+        activity, mood = activity[:, :-lag], mood[:, lag:]
+
+    paired = ~np.isnan(mood)
+    n = paired.sum(axis=1)
+    x = np.where(paired, activity, 0.0)
+    y = np.where(paired, mood, 0.0)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_x = x.sum(axis=1) / n
+        mean_y = y.sum(axis=1) / n
+        dx = np.where(paired, x - mean_x[:, None], 0.0)
+        dy = np.where(paired, y - mean_y[:, None], 0.0)
+        r = (dx * dy).sum(axis=1) / np.sqrt((dx * dx).sum(axis=1) * (dy * dy).sum(axis=1))
+
+        did = paired & (x > 0)
+        did_not = paired & (x == 0)
+        mood_with = np.where(did, y, 0.0).sum(axis=1) / did.sum(axis=1)
+        mood_without = np.where(did_not, y, 0.0).sum(axis=1) / did_not.sum(axis=1)
+
+    # Constant activity or mood has no defined correlation
+    r[(n < MIN_PAIRED_DAYS) | ~np.isfinite(r)] = np.nan
+    return {"r": r, "n": n, "mood_with": mood_with, "mood_without": mood_without}
+
+
+def _rounded(value: float, digits: int):
+    return round(float(value), digits) if np.isfinite(value) else None
+
+
+def summarize_user(scores: Dict[Tuple[str, int], Dict[str, np.ndarray]], user_index: int) -> Tuple[list, list]:
+    """Turn one user's row of the batch scores into (correlations, highlights)"""
+    correlations = []
+    highlights = []
+    for (activity, lag), result in scores.items():
+        r = result["r"][user_index]
+        if not np.isfinite(r):
+            continue
+        correlation = {
+            "activity": activity,
+            "lag_days": lag,
+            "correlation": _rounded(r, 3),
+            "paired_days": int(result["n"][user_index]),
+            "mood_with": _rounded(result["mood_with"][user_index], 2),
+            "mood_without": _rounded(result["mood_without"][user_index], 2),
+        }
+        correlations.append(correlation)
+
+        difference = (correlation["mood_with"] or 0) - (correlation["mood_without"] or 0)
+        if lag == 1 and r >= HIGHLIGHT_MIN_CORRELATION and difference > 0:
+            highlights.append({
+                "activity": activity,
+                "correlation": correlation["correlation"],
+                "message": (
+                    f"Nos dias seguintes aos que você {ACTIVITIES[activity]}, seu humor "
+                    f"costuma ser {difference:.1f} ponto(s) maior."
+                ),
+            })
+
+    highlights.sort(key=lambda highlight: highlight["correlation"], reverse=True)
+    return correlations, highlights
+
+
+def compute_batch_insights(user_ids: List[str], signals: Dict[str, list], start_day: date, num_days: int) -> List[dict]:
+    """Insight documents for a batch of users.
+
+    `signals` maps "mood" and each key of ACTIVITIES to (user_index, local day,
+    value) records, user_index being the position in `user_ids`.
+    """
+    num_users = len(user_ids)
+    mood = build_grid(signals.get("mood", []), num_users, start_day, num_days, reduce="last")
+    scores = {
+        (activity, lag): lagged_correlations(
+            build_grid(signals.get(activity, []), num_users, start_day, num_days), mood, lag
+        )
+        for activity in ACTIVITIES
+        for lag in LAGS
+    }
+
+    days_with_mood = (~np.isnan(mood)).sum(axis=1)
+    computed_at = datetime.utcnow()
+    documents = []
+    for user_index, user_id in enumerate(user_ids):
+        if days_with_mood[user_index] == 0:
+            continue
+        correlations, highlights = summarize_user(scores, user_index)
+        documents.append({
+            "user_id": user_id,
+            "computed_at": computed_at,
+            "start_date": start_day.isoformat(),
+            "end_date": (start_day + timedelta(days=num_days - 1)).isoformat(),
+            "days_with_mood": int(days_with_mood[user_index]),
+            "correlations": correlations,
+            "highlights": highlights,
+        })
+    return documents
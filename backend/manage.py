@@ -0,0 +1,419 @@
+"""Administrative commands for the backend.
+
+Run from the backend directory, e.g. ``python manage.py migrate-profile-photos``.
+"""
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+import typer
+from bson import ObjectId
+from pymongo import ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+import insights
+import server
+
+cli = typer.Typer(help="Administrative commands for the Humor Diário backend")
+
+
+async def _migrate_profile_photos() -> int:
+    migrated = 0
+    cursor = server.db.users.find(
+        {"profile_photo": {"$exists": True, "$ne": None}},
+        {"email": 1, "profile_photo": 1}
+    )
+    async for user in cursor:
+        try:
+            photo_hash = await server.store_profile_photo(user["profile_photo"])
+        except Exception as e:
+            typer.echo(f"Skipping {user['email']}: {e}")
+            continue
+
+        await server.db.users.update_one(
+            {"_id": user["_id"]},
+            {
+                "$set": {"profile_photo_hash": photo_hash},
+                "$unset": {"profile_photo": ""},
+                "$inc": {"profile_version": 1}
+            }
+        )
+        migrated += 1
+    return migrated
+
+
+@cli.command("migrate-profile-photos")
+def migrate_profile_photos():
+    """Move inline base64 profile photos from users documents into the blob store"""
+    migrated = asyncio.run(_migrate_profile_photos())
+    typer.echo(f"Migrated {migrated} profile photos")
+
+
+async def _backfill_mood_day_keys(batch_size: int) -> tuple:
+    updated = 0
+    removed = 0
+    # Newest first: when a legacy day has several entries the newest one keeps the day_key
+    cursor = server.db.humor_diario.find(
+        {"day_key": {"$exists": False}},
+        {"_id": 1, "date": 1}
+    ).sort("date", -1)
+
+    async def flush(batch):
+        nonlocal updated, removed
+        if not batch:
+            return
+        try:
+            result = await server.db.humor_diario.bulk_write(
+                [UpdateOne({"_id": _id}, {"$set": {"day_key": day_key}}) for _id, day_key in batch],
+                ordered=False
+            )
+            updated += result.modified_count
+        except BulkWriteError as e:
+            updated += e.details.get("nModified", 0)
+            duplicates = [batch[error["index"]][0] for error in e.details["writeErrors"] if error["code"] == 11000]
+            if duplicates:
+                delete_result = await server.db.humor_diario.delete_many({"_id": {"$in": duplicates}})
+                removed += delete_result.deleted_count
+
+    batch = []
+    async for entry in cursor:
+        # Legacy entries were recorded under UTC days, so keep that day
+        batch.append((entry["_id"], entry["date"].date().isoformat()))
+        if len(batch) >= batch_size:
+            await flush(batch)
+            batch = []
+    await flush(batch)
+    return updated, removed
+
+
+@cli.command("backfill-mood-day-keys")
+def backfill_mood_day_keys(batch_size: int = 1000):
+    """Add day_key to legacy mood entries, dropping older duplicates of the same day"""
+    updated, removed = asyncio.run(_backfill_mood_day_keys(batch_size))
+    typer.echo(f"Backfilled {updated} mood entries, removed {removed} duplicates")
+
+
+async def _migrate_mood_buckets(batch_size: int) -> int:
+    written = 0
+    operations = []
+    current_user = None
+    months = {}
+
+    def bucket_operations(user_id, months):
+        return [
+            UpdateOne(
+                {"user_id": user_id, "month": month},
+                {"$set": {"entries": sorted(entries_by_day.values(), key=lambda entry: entry["day"])}},
+                upsert=True
+            )
+            for month, entries_by_day in months.items()
+        ]
+
+    # Oldest first per user so the newest entry of a day wins. A user's months are
+    # collected whole: local months need not follow UTC order after a zone change.
+    cursor = server.db.humor_diario.find({}, {"_id": 0}).sort([("user_id", 1), ("date", 1)])
+    async for mood in cursor:
+        if mood["user_id"] != current_user:
+            if current_user is not None:
+                operations.extend(bucket_operations(current_user, months))
+            current_user, months = mood["user_id"], {}
+
+        # Buckets are keyed by local day; legacy entries without a day_key keep their UTC day
+        day = server.mood_entry_day(mood)
+        emoji = mood.get("mood_emoji")
+        months.setdefault(server.mood_month_key(day), {})[day.day] = {
+            "day": day.day,
+            "id": mood["id"],
+            "level": mood["mood_level"],
+            "emoji_code": server.MOOD_EMOJIS.index(emoji) if emoji in server.MOOD_EMOJIS else mood["mood_level"] - 1,
+            "description": mood.get("description"),
+            "date": mood["date"]
+        }
+
+        if len(operations) >= batch_size:
+            await server.db.humor_diario_buckets.bulk_write(operations, ordered=False)
+            written += len(operations)
+            operations = []
+
+    if current_user is not None:
+        operations.extend(bucket_operations(current_user, months))
+    if operations:
+        await server.db.humor_diario_buckets.bulk_write(operations, ordered=False)
+        written += len(operations)
+    return written
+
+
+@cli.command("migrate-mood-buckets")
+def migrate_mood_buckets(batch_size: int = 500):
+    """Build monthly mood buckets from humor_diario (idempotent; source documents are kept)"""
+    written = asyncio.run(_migrate_mood_buckets(batch_size))
+    typer.echo(f"Wrote {written} monthly mood buckets")
+
+
+DAY_KEYED_COLLECTIONS = ("gratitude_entries", "user_mission_progress", "daily_mission_sets")
+
+
+async def _backfill_day_keys(batch_size: int) -> dict:
+    updated = {}
+    for name in DAY_KEYED_COLLECTIONS:
+        collection = server.db[name]
+        updated[name] = 0
+        cursor = collection.find({"day_key": None}, {"_id": 1, "date": 1})
+
+        async def flush(batch):
+            if not batch:
+                return
+            try:
+                result = await collection.bulk_write(
+                    [UpdateOne({"_id": _id}, {"$set": {"day_key": day_key}}) for _id, day_key in batch],
+                    ordered=False
+                )
+                updated[name] += result.modified_count
+            except BulkWriteError as e:
+                # Duplicates of an already keyed day stay unkeyed rather than being deleted
+                updated[name] += e.details.get("nModified", 0)
+
+        batch = []
+        async for document in cursor:
+            # Legacy documents were recorded under UTC days, so keep that day
+            batch.append((document["_id"], document["date"].date().isoformat()))
+            if len(batch) >= batch_size:
+                await flush(batch)
+                batch = []
+        await flush(batch)
+    return updated
+
+
+@cli.command("backfill-day-keys")
+def backfill_day_keys(batch_size: int = 1000):
+    """Add day_key to legacy gratitude entries, mission progress and daily mission sets"""
+    updated = asyncio.run(_backfill_day_keys(batch_size))
+    for name, count in updated.items():
+        typer.echo(f"Backfilled {count} documents in {name}")
+
+
+SYNCED_COLLECTIONS = (
+    "humor_diario", "gratitude_entries", "breathing_sessions",
+    "user_reminders", "user_mission_progress", "user_stats"
+)
+
+
+async def _backfill_sync_versions(batch_size: int) -> dict:
+    stamped = {}
+    for name in SYNCED_COLLECTIONS:
+        collection = server.db[name]
+        stamped[name] = 0
+        # Versions come from each user's counter, so stamp one user at a time
+        for user_id in await collection.distinct("user_id", {"sync_version": None}):
+            ids = [
+                document["_id"]
+                async for document in collection.find({"user_id": user_id, "sync_version": None}, {"_id": 1})
+            ]
+            first_version = await server.next_sync_version(user_id, len(ids)) - len(ids) + 1
+            operations = [
+                UpdateOne({"_id": _id, "sync_version": None}, {"$set": {"sync_version": first_version + offset}})
+                for offset, _id in enumerate(ids)
+            ]
+            for start in range(0, len(operations), batch_size):
+                await collection.bulk_write(operations[start:start + batch_size], ordered=False)
+            stamped[name] += len(ids)
+
+    stamped["humor_diario_buckets"] = 0
+    cursor = server.db.humor_diario_buckets.find(
+        {"entries": {"$elemMatch": {"sync_version": None}}},
+        {"user_id": 1, "entries.id": 1, "entries.sync_version": 1}
+    )
+    async for bucket in cursor:
+        missing = [entry["id"] for entry in bucket["entries"] if entry.get("sync_version") is None]
+        first_version = await server.next_sync_version(bucket["user_id"], len(missing)) - len(missing) + 1
+        await server.db.humor_diario_buckets.bulk_write([
+            UpdateOne(
+                {"_id": bucket["_id"]},
+                {"$set": {"entries.$[entry].sync_version": first_version + offset}},
+                array_filters=[{"entry.id": entry_id, "entry.sync_version": None}]
+            )
+            for offset, entry_id in enumerate(missing)
+        ], ordered=False)
+        stamped["humor_diario_buckets"] += len(missing)
+    return stamped
+
+
+@cli.command("backfill-sync-versions")
+def backfill_sync_versions(batch_size: int = 1000):
+    """Stamp sync versions on documents written before delta sync existed"""
+    stamped = asyncio.run(_backfill_sync_versions(batch_size))
+    for name, count in stamped.items():
+        typer.echo(f"Stamped {count} documents in {name}")
+
+
+async def _rebuild_mood_rollups() -> tuple:
+    users = 0
+    written = 0
+    collection = server.db.humor_diario_buckets if server.MOOD_STORAGE_MODE == "buckets" else server.db.humor_diario
+    for user_id in await collection.distinct("user_id"):
+        written += await server.rebuild_user_mood_rollups(user_id)
+        users += 1
+    return users, written
+
+
+@cli.command("rebuild-mood-rollups")
+def rebuild_mood_rollups():
+    """Recompute weekly and monthly mood rollups from the stored entries"""
+    users, written = asyncio.run(_rebuild_mood_rollups())
+    typer.echo(f"Rebuilt {written} mood rollups for {users} users")
+
+
+async def _insight_signals(users: list, since: datetime) -> tuple:
+    """Load a batch's mood and activity records as (user_index, local day, value) signals"""
+    user_ids = [str(user["_id"]) for user in users]
+    index = {user_id: position for position, user_id in enumerate(user_ids)}
+    zones = {str(user["_id"]): user.get("timezone", server.DEFAULT_TIMEZONE) for user in users}
+
+    def local_day(document):
+        if document.get("day_key"):
+            return server.day_from_key(document["day_key"])
+        return server.local_datetime(document["date"], zones[document["user_id"]]).date()
+
+    signals = {"mood": [], **{activity: [] for activity in insights.ACTIVITIES}}
+    async for mood in server.mood_levels_cursor(user_ids, since):
+        signals["mood"].append((index[mood["user_id"]], local_day(mood), mood["mood_level"]))
+
+    activity_sources = {
+        "missions": (server.db.user_mission_progress, {"completed": True}),
+        "breathing": (server.db.breathing_sessions, {"completed": True}),
+        "gratitude": (server.db.gratitude_entries, {})
+    }
+    for activity, (collection, match) in activity_sources.items():
+        cursor = collection.find(
+            {"user_id": {"$in": user_ids}, "date": {"$gte": since}, **match},
+            {"_id": 0, "user_id": 1, "date": 1, "day_key": 1}
+        )
+        async for document in cursor:
+            signals[activity].append((index[document["user_id"]], local_day(document), 1))
+    return user_ids, signals
+
+
+async def _compute_insights(batch_size: int, window_days: int) -> tuple:
+    end_day = datetime.utcnow().date()
+    start_day = end_day - timedelta(days=window_days - 1)
+    # A day of slack covers users whose local day starts before UTC's
+    since = datetime.combine(start_day - timedelta(days=1), datetime.min.time())
+    processed = 0
+    written = 0
+
+    async def flush(users):
+        nonlocal processed, written
+        user_ids, signals = await _insight_signals(users, since)
+        documents = insights.compute_batch_insights(user_ids, signals, start_day, window_days)
+        if documents:
+            await server.db.insights.bulk_write(
+                [ReplaceOne({"user_id": document["user_id"]}, document, upsert=True) for document in documents],
+                ordered=False
+            )
+        processed += len(users)
+        written += len(documents)
+
+    batch = []
+    async for user in server.db.users.find({}, {"_id": 1, "timezone": 1}).batch_size(batch_size):
+        batch.append(user)
+        if len(batch) >= batch_size:
+            await flush(batch)
+            batch = []
+    if batch:
+        await flush(batch)
+    return processed, written
+
+
+@cli.command("compute-insights")
+def compute_insights(batch_size: int = 500, window_days: int = 90):
+    """Recompute activity/mood correlations for every user (run nightly)"""
+    processed, written = asyncio.run(_compute_insights(batch_size, window_days))
+    typer.echo(f"Computed insights for {written} of {processed} users")
+
+
+@cli.command("sync-mission-catalog")
+def sync_mission_catalog(force: bool = False):
+    """Apply the mission catalog shipped with this release to the database; running workers reload it"""
+    result = asyncio.run(server.sync_mission_catalog(force))
+    typer.echo(
+        f"Mission catalog {result['version']} {result['status']}: "
+        f"{result['upserted']} upserted, {result['removed']} removed"
+    )
+
+
+async def _mission_assignments(user_ids: list, now: datetime) -> list:
+    """(user_id, user_level, tomorrow's local day_key) for a chunk of users"""
+    object_ids = [ObjectId(user_id) for user_id in user_ids if ObjectId.is_valid(user_id)]
+    zones = {
+        str(user["_id"]): user.get("timezone", server.DEFAULT_TIMEZONE)
+        async for user in server.db.users.find({"_id": {"$in": object_ids}}, {"timezone": 1})
+    }
+    levels = {
+        stats["user_id"]: stats.get("current_level", 1)
+        async for stats in server.db.user_stats.find({"user_id": {"$in": user_ids}}, {"user_id": 1, "current_level": 1})
+    }
+    return [
+        (user_id, levels.get(user_id, 1), (server.local_datetime(now, zone).date() + timedelta(days=1)).isoformat())
+        for user_id, zone in zones.items()
+    ]
+
+
+async def _pregenerate_mission_sets(chunk_size: int, workers: int, active_days: int) -> tuple:
+    catalog = await server.load_mission_catalog()
+    missions = catalog.documents()
+    now = datetime.utcnow()
+    loop = asyncio.get_running_loop()
+    created = 0
+    existing = 0
+
+    async def generate(user_ids):
+        nonlocal created, existing
+        assignments = await _mission_assignments(user_ids, now)
+        documents = await loop.run_in_executor(pool, server.generate_mission_sets, missions, catalog.version, assignments)
+        if not documents:
+            return
+        try:
+            result = await server.db.daily_mission_sets.insert_many(documents, ordered=False)
+            created += len(result.inserted_ids)
+        except BulkWriteError as e:
+            # Sets a user already has for that day are kept; the unique (user_id, day_key) index rejects ours
+            created += e.details.get("nInserted", 0)
+            existing += sum(1 for error in e.details.get("writeErrors", []) if error["code"] == 11000)
+
+    # Active users: anyone who worked on a mission in the last `active_days` days
+    cutoff = (now - timedelta(days=active_days)).date().isoformat()
+    cursor = server.db.user_mission_progress.aggregate(
+        [{"$match": {"day_key": {"$gte": cutoff}}}, {"$group": {"_id": "$user_id"}}],
+        allowDiskUse=True
+    )
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        in_flight = set()
+        chunk = []
+        async for group in cursor:
+            chunk.append(group["_id"])
+            if len(chunk) >= chunk_size:
+                in_flight.add(asyncio.create_task(generate(chunk)))
+                chunk = []
+                # Keep about one chunk per worker in flight while the cursor streams on
+                if len(in_flight) >= workers:
+                    done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        task.result()
+        if chunk:
+            in_flight.add(asyncio.create_task(generate(chunk)))
+        for task in asyncio.as_completed(in_flight):
+            await task
+    return created, existing
+
+
+@cli.command("pregenerate-mission-sets")
+def pregenerate_mission_sets(chunk_size: int = 1000, workers: int = os.cpu_count() or 1, active_days: int = 14):
+    """Freeze tomorrow's daily mission sets for active users ahead of the morning peak, so first views only read"""
+    created, existing = asyncio.run(_pregenerate_mission_sets(chunk_size, workers, active_days))
+    typer.echo(f"Created {created} daily mission sets ({existing} already existed)")
+
+
+if __name__ == "__main__":
+    cli()
@@ -33,8 +33,11 @@ class Mission(BaseModel):
 class DailyMissionSet(BaseModel):
     id: str = Field(..., description="Unique daily set ID")
     date: datetime = Field(..., description="Date for these missions")
+    day_key: Optional[str] = Field(None, description="Local day (YYYY-MM-DD) in the user's time zone")
     missions: List[str] = Field(..., description="List of mission IDs for this day")
     user_id: str = Field(..., description="User ID (for personalization)")
+    user_level: Optional[int] = Field(None, description="User level the set was picked for")
+    catalog_version: Optional[str] = Field(None, description="Mission catalog version the set was picked from")
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 class UserMissionProgress(BaseModel):
@@ -42,6 +45,7 @@ class UserMissionProgress(BaseModel):
     user_id: str = Field(..., description="User ID")
     mission_id: str = Field(..., description="Mission ID")
     date: datetime = Field(..., description="Date of completion")
+    day_key: Optional[str] = Field(None, description="Local day (YYYY-MM-DD) in the user's time zone")
     completed: bool = Field(False, description="Whether mission was completed")
     completed_at: Optional[datetime] = Field(None, description="When mission was completed")
     xp_earned: int = Field(0, description="XP earned from this mission")
\ No newline at end of file
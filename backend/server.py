@@ -1,8 +1,13 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, Request
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, Request, BackgroundTasks
+from fastapi.responses import Response, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorGridFSBucket
+from gridfs.errors import NoFile
+from pymongo import DeleteMany, ReturnDocument, ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from bson import ObjectId
 import os
 import logging
 from pathlib import Path
@@ -11,13 +16,32 @@ from typing import List, Optional
 import uuid
 from datetime import datetime, timedelta
 import bcrypt
-from jose import JWTError, jwt
 import re
+import io
+import csv
+import json
+import base64
+import time
+import hashlib
+import itertools
+import secrets
+import tempfile
+import asyncio
+import random
+from bisect import bisect_right
+from functools import lru_cache
+from types import MappingProxyType
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from collections import OrderedDict, deque
+import numpy as np
+from PIL import Image
 from emergentintegrations.payments.stripe.checkout import StripeCheckout, CheckoutSessionResponse, CheckoutStatusResponse, CheckoutSessionRequest
 from emergentintegrations.llm.chat import LlmChat, UserMessage
 from models.chat import ChatMessage, ChatConversation, SendMessageRequest, ChatResponse, MessageRole
 from models.missions import Mission, MissionCategory, MissionDifficulty, DailyMissionSet, UserMissionProgress
 from models.payments import PaymentTransaction, EbookPackage, EBOOK_PACKAGES
+from token_backend import TokenBackend, TokenError
 from enum import Enum
 
 ROOT_DIR = Path(__file__).parent
@@ -27,6 +51,7 @@ load_dotenv(ROOT_DIR / '.env')
 mongo_url = os.environ['MONGO_URL']
 client = AsyncIOMotorClient(mongo_url)
 db = client.get_database('mental_health_app')
+profile_photo_bucket = AsyncIOMotorGridFSBucket(db, bucket_name="profile_photos")
 
 # Stripe configuration
 STRIPE_API_KEY = os.environ.get('STRIPE_API_KEY')
@@ -78,9 +103,84 @@ class CreateCheckoutRequest(BaseModel):
 
 # JWT Configuration
 SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'your-secret-key-here-change-in-production')
-ALGORITHM = "HS256"
+ALGORITHM = os.environ.get('JWT_ALGORITHM', 'HS256')  # HS256 or EdDSA
+JWT_LIBRARY = os.environ.get('JWT_LIBRARY', 'pyjwt')  # pyjwt or jose
+token_backend = TokenBackend(
+    library=JWT_LIBRARY,
+    algorithm=ALGORITHM,
+    secret_key=SECRET_KEY,
+    private_key_pem=os.environ.get('JWT_PRIVATE_KEY'),
+    public_key_pem=os.environ.get('JWT_PUBLIC_KEY')
+)
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# Authenticated user cache configuration
+USER_CACHE_MAX_SIZE = int(os.environ.get('USER_CACHE_MAX_SIZE', '10000'))
+USER_CACHE_TTL_SECONDS = float(os.environ.get('USER_CACHE_TTL_SECONDS', '60'))
+
+# Per-user mood analytics cache
+MOOD_CACHE_MAX_SIZE = int(os.environ.get('MOOD_CACHE_MAX_SIZE', '10000'))
+MOOD_CACHE_TTL_SECONDS = float(os.environ.get('MOOD_CACHE_TTL_SECONDS', '300'))
+
+# Password hashing pool configuration ("thread" or "process")
+PASSWORD_HASH_EXECUTOR = os.environ.get('PASSWORD_HASH_EXECUTOR', 'thread')
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_MAX_QUEUE = int(os.environ.get('PASSWORD_HASH_MAX_QUEUE', '32'))
+
+# bcrypt cost: calibrated at startup against BCRYPT_TARGET_MS unless BCRYPT_ROUNDS pins it
+BCRYPT_ROUNDS = int(os.environ['BCRYPT_ROUNDS']) if os.environ.get('BCRYPT_ROUNDS') else None
+BCRYPT_TARGET_MS = float(os.environ.get('BCRYPT_TARGET_MS', '250'))
+# Never calibrate below the cost existing hashes were created with
+BCRYPT_MIN_ROUNDS = int(os.environ.get('BCRYPT_MIN_ROUNDS', '12'))
+BCRYPT_MAX_ROUNDS = int(os.environ.get('BCRYPT_MAX_ROUNDS', '14'))
+
+# Self-contained token claims (opt-in) and revocation list refresh
+JWT_EMBED_USER_CLAIMS = os.environ.get('JWT_EMBED_USER_CLAIMS', 'false').lower() == 'true'
+TOKEN_REVOCATION_REFRESH_SECONDS = int(os.environ.get('TOKEN_REVOCATION_REFRESH_SECONDS', '60'))
+
+# Mission catalog: how often workers check the stored catalog version
+MISSION_CATALOG_REFRESH_SECONDS = int(os.environ.get('MISSION_CATALOG_REFRESH_SECONDS', '300'))
+
+# Profile photo blob store
+PROFILE_PHOTO_THUMBNAIL_SIZE = int(os.environ.get('PROFILE_PHOTO_THUMBNAIL_SIZE', '256'))
+PROFILE_PHOTO_CHUNK_SIZE = 256 * 1024
+
+# Bulk employee provisioning
+ADMIN_API_KEY = os.environ.get('ADMIN_API_KEY')
+PROVISIONING_CHUNK_SIZE = int(os.environ.get('PROVISIONING_CHUNK_SIZE', '500'))
+
+# Uploaded CSV/NDJSON bodies stay in memory up to this size, then spill to a temp file
+UPLOAD_SPOOL_MAX_MEMORY = int(os.environ.get('UPLOAD_SPOOL_MAX_MEMORY', str(8 * 1024 * 1024)))
+UPLOAD_READ_CHUNK_SIZE = 64 * 1024
+
+# Rate limiting for unauthenticated bcrypt endpoints
+AUTH_RATE_LIMIT_CAPACITY = int(os.environ.get('AUTH_RATE_LIMIT_CAPACITY', '10'))
+AUTH_RATE_LIMIT_PER_MINUTE = float(os.environ.get('AUTH_RATE_LIMIT_PER_MINUTE', '10'))
+AUTH_LOCKOUT_THRESHOLD = int(os.environ.get('AUTH_LOCKOUT_THRESHOLD', '5'))
+AUTH_LOCKOUT_WINDOW_SECONDS = int(os.environ.get('AUTH_LOCKOUT_WINDOW_SECONDS', '900'))
+AUTH_LOCKOUT_SECONDS = int(os.environ.get('AUTH_LOCKOUT_SECONDS', '900'))
+AUTH_THROTTLE_SHARED = os.environ.get('AUTH_THROTTLE_SHARED', 'false').lower() == 'true'
+AUTH_THROTTLE_MAX_KEYS = int(os.environ.get('AUTH_THROTTLE_MAX_KEYS', '100000'))
+TRUST_PROXY_HEADERS = os.environ.get('TRUST_PROXY_HEADERS', 'false').lower() == 'true'
+
+# Mood storage: "documents" (one humor_diario document per day) or "buckets" (one per user and month)
+MOOD_STORAGE_MODE = os.environ.get('MOOD_STORAGE_MODE', 'documents')
+MOOD_IMPORT_CHUNK_SIZE = int(os.environ.get('MOOD_IMPORT_CHUNK_SIZE', '1000'))
+
+# Delta sync: maximum documents per collection in one /api/sync response
+SYNC_PAGE_SIZE = int(os.environ.get('SYNC_PAGE_SIZE', '500'))
+SYNC_MAX_WRITES = int(os.environ.get('SYNC_MAX_WRITES', '100'))
+# A pull never moves a client past versions reserved this recently: their writes may still be in flight
+SYNC_WRITE_GRACE_SECONDS = float(os.environ.get('SYNC_WRITE_GRACE_SECONDS', '30'))
+# Recent reservations remembered per user (covers a full push of SYNC_MAX_WRITES with room to spare)
+SYNC_RESERVATION_HISTORY = 2 * SYNC_MAX_WRITES
+
+# Local days: zone used for users that have not chosen one
+DEFAULT_TIMEZONE = os.environ.get('DEFAULT_TIMEZONE', 'America/Sao_Paulo')
+
+# Refresh tokens
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.environ.get('REFRESH_TOKEN_EXPIRE_DAYS', '30'))
+
 # Create the main app without a prefix
 app = FastAPI()
 
@@ -91,11 +191,19 @@ api_router = APIRouter(prefix="/api")
 security = HTTPBearer()
 
 # User Models
+def is_valid_timezone(name: str) -> bool:
+    try:
+        ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return False
+    return True
+
 class UserCreate(BaseModel):
     name: str
     email: EmailStr
     password: str
     confirm_password: str
+    timezone: Optional[str] = None  # IANA name, e.g. "America/Sao_Paulo"
     
     @validator('name')
     def name_must_not_be_empty(cls, v):
@@ -116,8 +224,25 @@ class UserCreate(BaseModel):
         if 'password' in values and v != values['password']:
             raise ValueError('Senhas não coincidem')
         return v
+    
+    @validator('timezone')
+    def validate_timezone(cls, v):
+        if v is not None and not is_valid_timezone(v):
+            raise ValueError('Fuso horário inválido')
+        return v
+
+class TimezoneUpdate(BaseModel):
+    timezone: str
+    
+    @validator('timezone')
+    def validate_timezone(cls, v):
+        if not is_valid_timezone(v):
+            raise ValueError('Fuso horário inválido')
+        return v
 
 # Mood Models
+MOOD_EMOJIS = ['😢', '😞', '😐', '😊', '😄']  # Index is the emoji_code stored in mood buckets
+
 class MoodCreate(BaseModel):
     mood_level: int = Field(..., ge=1, le=5, description="Nível do humor de 1 (muito triste) a 5 (muito feliz)")
     mood_emoji: str
@@ -125,10 +250,36 @@ class MoodCreate(BaseModel):
     
     @validator('mood_emoji')
     def validate_emoji(cls, v):
-        valid_emojis = ['😢', '😞', '😐', '😊', '😄']
-        if v not in valid_emojis:
+        if v not in MOOD_EMOJIS:
+            raise ValueError('Emoji de humor inválido')
+        return v
+
+class MoodImportRow(BaseModel):
+    date: datetime
+    mood_level: int = Field(..., ge=1, le=5)
+    mood_emoji: Optional[str] = None
+    description: Optional[str] = Field(None, max_length=500)
+    
+    @validator('date')
+    def normalize_date(cls, v):
+        # Stored dates are naive UTC; naive input is taken as UTC already
+        if v.tzinfo is not None:
+            return v.astimezone(UTC_ZONE).replace(tzinfo=None)
+        return v
+    
+    @validator('mood_emoji', always=True)
+    def validate_emoji(cls, v, values):
+        if not v:
+            # Other apps rarely export our emoji; derive it from the level
+            level = values.get('mood_level')
+            return MOOD_EMOJIS[level - 1] if level else v
+        if v not in MOOD_EMOJIS:
             raise ValueError('Emoji de humor inválido')
         return v
+    
+    @validator('description')
+    def empty_description_is_none(cls, v):
+        return v or None
 
 class MoodEntry(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -137,6 +288,7 @@ class MoodEntry(BaseModel):
     mood_emoji: str
     description: Optional[str]
     date: datetime = Field(default_factory=datetime.utcnow)
+    day_key: Optional[str] = None  # "YYYY-MM-DD", unique per user
 
 class MoodResponse(BaseModel):
     id: str
@@ -217,12 +369,28 @@ class User(BaseModel):
     name: str
     email: str
     profile_photo: Optional[str] = None
+    timezone: str = DEFAULT_TIMEZONE
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 class Token(BaseModel):
     access_token: str
     token_type: str
     user: User
+    refresh_token: Optional[str] = None
+
+class TokenRefreshRequest(BaseModel):
+    refresh_token: str
+
+class LogoutRequest(BaseModel):
+    refresh_token: Optional[str] = None
+
+class TokenClaims(BaseModel):
+    """Identity carried by the access token itself (claims-only authentication)"""
+    id: str
+    email: str
+    name: str
+    profile_version: int = 0
+    timezone: str = DEFAULT_TIMEZONE
 
 class StatusCheck(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -232,16 +400,388 @@ class StatusCheck(BaseModel):
 class StatusCheckCreate(BaseModel):
     client_name: str
 
+# Process-local caches
+class TTLCache:
+    """Process-local LRU cache with TTL expiry and hit/miss/eviction counters"""
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            # Expired entries count as a miss and are dropped eagerly
+            del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value):
+        if self.max_size <= 0:
+            return
+
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: str):
+        """Drop a cached value; must be called after every mutation of its source"""
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
+
+# Resolved users keyed by token subject
+user_cache = TTLCache(USER_CACHE_MAX_SIZE, USER_CACHE_TTL_SECONDS)
+
+# Results derived from a user's mood entries; keys embed a per-user version bumped on every mood write.
+# The version lives in the same bounded cache, and invalidation only reaches this worker:
+# other workers keep serving their entries until MOOD_CACHE_TTL_SECONDS expires them.
+mood_cache = TTLCache(MOOD_CACHE_MAX_SIZE, MOOD_CACHE_TTL_SECONDS)
+# Versions are never reused, so an expired or evicted version cannot resurrect old entries
+mood_cache_generations = itertools.count(1)
+
+def mood_cache_key(user_id: str, *parts) -> str:
+    version = mood_cache.get(f"version:{user_id}") or 0
+    return ":".join([user_id, str(version), *map(str, parts)])
+
+def invalidate_mood_caches(user_id: str):
+    """Orphan every cached mood result of a user; stale entries age out of the LRU"""
+    mood_cache.set(f"version:{user_id}", next(mood_cache_generations))
+
 # Helper functions
-def hash_password(password: str) -> str:
+def hash_password(password: str, rounds: int = 12) -> str:
     """Hash a password using bcrypt"""
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds=rounds)
     return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
 
+def bcrypt_rounds(hashed: str) -> int:
+    """Cost factor recorded in a bcrypt hash ("$2b$<rounds>$...")"""
+    return int(hashed.split('$')[2])
+
+def calibrate_bcrypt_rounds(target_ms: float, min_rounds: int, max_rounds: int) -> tuple:
+    """Pick the highest bcrypt cost whose hash time stays within target_ms on this host.
+
+    Each extra round doubles the work, so a single measurement at min_rounds
+    is enough to extrapolate the rest. Returns (rounds, measured_ms_at_min_rounds).
+    """
+    password = secrets.token_hex(8)
+    # Best of three to discount scheduler noise
+    measured = min(_timed_call(hash_password, password, min_rounds)[1] for _ in range(3)) * 1000
+    
+    rounds = min_rounds
+    while rounds < max_rounds and measured * 2 ** (rounds + 1 - min_rounds) <= target_ms:
+        rounds += 1
+    return rounds, measured
+
 def verify_password(password: str, hashed: str) -> bool:
     """Verify a password against its hash"""
     return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
 
+def _timed_call(func, *args):
+    """Run func in a pool worker and report how long the call itself took"""
+    started = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - started
+
+class PasswordHashPool:
+    """Bounded executor that keeps bcrypt work off the event loop"""
+
+    def __init__(self, kind: str, max_workers: int, max_queue: int):
+        self.kind = kind
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.rounds = BCRYPT_ROUNDS or 12
+        self.rounds_source = "configured" if BCRYPT_ROUNDS else "default"
+        self._executor = None
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.total_hash_seconds = 0.0
+        self.max_hash_seconds = 0.0
+
+    def _get_executor(self):
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="password-hash")
+        return self._executor
+
+    async def run(self, func, *args):
+        # Reject before queueing so a login storm cannot pile up unbounded work
+        if self.in_flight >= self.max_workers + self.max_queue:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Servidor ocupado, tente novamente em instantes",
+                headers={"Retry-After": "1"}
+            )
+
+        self.in_flight += 1
+        started = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            result, hash_seconds = await loop.run_in_executor(self._get_executor(), _timed_call, func, *args)
+        finally:
+            self.in_flight -= 1
+
+        wait_seconds = max(0.0, time.perf_counter() - started - hash_seconds)
+        self.completed += 1
+        self.total_wait_seconds += wait_seconds
+        self.max_wait_seconds = max(self.max_wait_seconds, wait_seconds)
+        self.total_hash_seconds += hash_seconds
+        self.max_hash_seconds = max(self.max_hash_seconds, hash_seconds)
+        return result
+
+    async def calibrate(self):
+        """Benchmark bcrypt on this host and adopt the cost that meets BCRYPT_TARGET_MS"""
+        if BCRYPT_ROUNDS:
+            return
+        
+        loop = asyncio.get_running_loop()
+        rounds, measured_ms = await loop.run_in_executor(
+            self._get_executor(), calibrate_bcrypt_rounds, BCRYPT_TARGET_MS, BCRYPT_MIN_ROUNDS, BCRYPT_MAX_ROUNDS
+        )
+        self.rounds = rounds
+        self.rounds_source = "calibrated"
+        logger.info(f"bcrypt calibrated to {rounds} rounds ({measured_ms:.1f}ms at {BCRYPT_MIN_ROUNDS} rounds, target {BCRYPT_TARGET_MS}ms)")
+
+    async def hash(self, password: str) -> str:
+        return await self.run(hash_password, password, self.rounds)
+
+    def needs_rehash(self, hashed: str) -> bool:
+        # Only upgrade: a stronger stored hash is never rewritten with a lower cost
+        return bcrypt_rounds(hashed) < self.rounds
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        return await self.run(verify_password, password, hashed)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def stats(self) -> dict:
+        completed = self.completed or 1
+        return {
+            "executor": self.kind,
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "bcrypt_rounds": self.rounds,
+            "bcrypt_rounds_source": self.rounds_source,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_wait_ms": round(self.total_wait_seconds / completed * 1000, 2),
+            "max_wait_ms": round(self.max_wait_seconds * 1000, 2),
+            "avg_hash_ms": round(self.total_hash_seconds / completed * 1000, 2),
+            "max_hash_ms": round(self.max_hash_seconds * 1000, 2)
+        }
+
+password_hash_pool = PasswordHashPool(PASSWORD_HASH_EXECUTOR, PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_QUEUE)
+
+def client_ip(request: Request) -> str:
+    """Caller address, honouring X-Forwarded-For only behind a trusted proxy"""
+    if TRUST_PROXY_HEADERS:
+        forwarded = request.headers.get("X-Forwarded-For")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+class AuthRateLimiter:
+    """Token buckets per IP and per email plus a sliding-window lockout after repeated failures.
+
+    State is process-local; with AUTH_THROTTLE_SHARED lockouts are also
+    written to the auth_lockouts collection so every worker honours them.
+    """
+
+    def __init__(self):
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()
+        self._failures: "OrderedDict[str, deque]" = OrderedDict()
+        self._locked_until: dict = {}
+        self.throttled = 0
+        self.lockouts = 0
+
+    def _remember(self, store: OrderedDict, key: str, value):
+        store[key] = value
+        store.move_to_end(key)
+        while len(store) > AUTH_THROTTLE_MAX_KEYS:
+            store.popitem(last=False)
+
+    def _take_token(self, key: str, now: float) -> float:
+        """Consume one token; returns 0 on success or the seconds until a token is available"""
+        refill_per_second = AUTH_RATE_LIMIT_PER_MINUTE / 60
+        tokens, updated = self._buckets.get(key, (AUTH_RATE_LIMIT_CAPACITY, now))
+        tokens = min(AUTH_RATE_LIMIT_CAPACITY, tokens + (now - updated) * refill_per_second)
+        if tokens < 1:
+            self._remember(self._buckets, key, (tokens, now))
+            return (1 - tokens) / refill_per_second
+        self._remember(self._buckets, key, (tokens - 1, now))
+        return 0
+
+    def _reject(self, retry_after: float):
+        self.throttled += 1
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Muitas tentativas. Tente novamente mais tarde.",
+            headers={"Retry-After": str(max(1, int(retry_after + 0.999)))}
+        )
+
+    async def check(self, ip: str, email: str):
+        """Raise 429 before any hashing work when the caller is throttled or locked out"""
+        now = time.time()
+        email_key = f"email:{email.lower()}"
+        
+        locked_until = self._locked_until.get(email_key, 0)
+        if locked_until <= now and AUTH_THROTTLE_SHARED:
+            lockout = await db.auth_lockouts.find_one({"key": email_key})
+            if lockout:
+                locked_until = lockout["locked_until"].timestamp()
+                self._locked_until[email_key] = locked_until
+        if locked_until > now:
+            self._reject(locked_until - now)
+        
+        for key in (f"ip:{ip}", email_key):
+            retry_after = self._take_token(key, now)
+            if retry_after:
+                self._reject(retry_after)
+
+    async def record_failure(self, email: str):
+        now = time.time()
+        email_key = f"email:{email.lower()}"
+        failures = self._failures.get(email_key) or deque()
+        failures.append(now)
+        while failures and failures[0] <= now - AUTH_LOCKOUT_WINDOW_SECONDS:
+            failures.popleft()
+        self._remember(self._failures, email_key, failures)
+        
+        if len(failures) >= AUTH_LOCKOUT_THRESHOLD:
+            locked_until = now + AUTH_LOCKOUT_SECONDS
+            self._locked_until[email_key] = locked_until
+            failures.clear()
+            self.lockouts += 1
+            if AUTH_THROTTLE_SHARED:
+                expires_at = datetime.utcfromtimestamp(locked_until)
+                await db.auth_lockouts.update_one(
+                    {"key": email_key},
+                    {"$set": {"key": email_key, "locked_until": expires_at}},
+                    upsert=True
+                )
+        
+        # Drop expired lockouts so the map cannot grow without bound
+        if len(self._locked_until) > AUTH_THROTTLE_MAX_KEYS:
+            self._locked_until = {key: until for key, until in self._locked_until.items() if until > now}
+
+    def record_success(self, email: str):
+        self._failures.pop(f"email:{email.lower()}", None)
+
+    def stats(self) -> dict:
+        return {
+            "tracked_keys": len(self._buckets),
+            "active_lockouts": sum(1 for until in self._locked_until.values() if until > time.time()),
+            "throttled": self.throttled,
+            "lockouts": self.lockouts
+        }
+
+auth_rate_limiter = AuthRateLimiter()
+
+# Profile photo helpers
+def profile_photo_url(user: dict) -> Optional[str]:
+    """Public URL of a user's photo; legacy users may still carry an inline data URL"""
+    photo_hash = user.get('profile_photo_hash')
+    if photo_hash:
+        return f"/api/profile/photo/{photo_hash}"
+    return user.get('profile_photo')
+
+def decode_data_url(data_url: str) -> tuple:
+    """Split a base64 data URL into (content_type, raw bytes)"""
+    match = re.match(r'^data:(image/[\w.+-]+);base64,(.*)$', data_url, re.DOTALL)
+    if not match:
+        raise ValueError('Formato de imagem inválido')
+    return match.group(1), base64.b64decode(match.group(2), validate=True)
+
+def make_thumbnail(data: bytes) -> bytes:
+    """Downscale an image to a square-bounded JPEG thumbnail"""
+    image = Image.open(io.BytesIO(data))
+    image.thumbnail((PROFILE_PHOTO_THUMBNAIL_SIZE, PROFILE_PHOTO_THUMBNAIL_SIZE))
+    output = io.BytesIO()
+    image.convert("RGB").save(output, format="JPEG", quality=85)
+    return output.getvalue()
+
+async def store_profile_photo(data_url: str) -> str:
+    """Store a photo and its thumbnail once, keyed by the SHA-256 of the image bytes"""
+    try:
+        content_type, data = decode_data_url(data_url)
+    except (ValueError, base64.binascii.Error):
+        raise HTTPException(status_code=400, detail="Formato de imagem inválido")
+    
+    photo_hash = hashlib.sha256(data).hexdigest()
+    existing = await profile_photo_bucket.find({"filename": photo_hash}, limit=1).to_list(1)
+    if existing:
+        return photo_hash
+    
+    loop = asyncio.get_running_loop()
+    try:
+        thumbnail = await loop.run_in_executor(None, make_thumbnail, data)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Não foi possível processar a imagem")
+    
+    # Thumbnail first: the original's presence is what marks the photo as stored
+    await profile_photo_bucket.upload_from_stream(
+        f"{photo_hash}_thumb", thumbnail,
+        chunk_size_bytes=PROFILE_PHOTO_CHUNK_SIZE, metadata={"content_type": "image/jpeg"}
+    )
+    await profile_photo_bucket.upload_from_stream(
+        photo_hash, data,
+        chunk_size_bytes=PROFILE_PHOTO_CHUNK_SIZE, metadata={"content_type": content_type}
+    )
+    return photo_hash
+
+def parse_range_header(range_header: str, length: int) -> Optional[tuple]:
+    """Parse a single "bytes=start-end" range; returns None when unsatisfiable"""
+    match = re.match(r'^bytes=(\d*)-(\d*)$', range_header.strip())
+    if not match or (not match.group(1) and not match.group(2)):
+        return None
+    if match.group(1):
+        start = int(match.group(1))
+        end = int(match.group(2)) if match.group(2) else length - 1
+    else:
+        # Suffix range: the last N bytes
+        start = max(0, length - int(match.group(2)))
+        end = length - 1
+    end = min(end, length - 1)
+    if start > end:
+        return None
+    return start, end
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Create JWT access token"""
     to_encode = data.copy()
@@ -249,257 +789,1472 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    to_encode.update({"exp": expire, "jti": uuid.uuid4().hex})
+    encoded_jwt = token_backend.encode(to_encode)
     return encoded_jwt
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    """Get current user from JWT token"""
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
+def build_token_data(user: dict) -> dict:
+    """Build the JWT payload for a users document, embedding identity claims when enabled"""
+    data = {"sub": user['email']}
+    if JWT_EMBED_USER_CLAIMS:
+        data.update({
+            "uid": str(user['_id']),
+            "name": user['name'],
+            "pv": user.get('profile_version', 0),
+            "tz": user.get('timezone', DEFAULT_TIMEZONE)
+        })
+    return data
+
+def hash_refresh_token(refresh_token: str) -> str:
+    """Refresh tokens are high-entropy, so a plain SHA-256 is enough to store them safely"""
+    return hashlib.sha256(refresh_token.encode('utf-8')).hexdigest()
+
+async def issue_refresh_token(user_email: str, family_id: Optional[str] = None) -> str:
+    """Create a refresh token; rotated tokens share the family_id of the one they replace"""
+    refresh_token = secrets.token_urlsafe(48)
+    now = datetime.utcnow()
+    await db.refresh_tokens.insert_one({
+        "token_hash": hash_refresh_token(refresh_token),
+        "family_id": family_id or uuid.uuid4().hex,
+        "user_email": user_email,
+        "used": False,
+        "created_at": now,
+        "expires_at": now + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    })
+    return refresh_token
+
+class TokenRevocationList:
+    """Bloom filter of revoked token ids, rebuilt periodically from the revoked_tokens collection.
+
+    A negative answer is definitive and costs no I/O; a positive answer is
+    confirmed against the database to rule out false positives.
+    """
+
+    def __init__(self, size_bits: int = 1 << 20, num_hashes: int = 5):
+        self.size_bits = size_bits
+        self.num_hashes = num_hashes
+        self._bits = bytearray(size_bits // 8)
+        self.count = 0
+        self.refreshed_at: Optional[datetime] = None
+        self._added_during_refresh: Optional[List[str]] = None
+
+    def _positions(self, jti: str):
+        digest = hashlib.blake2b(jti.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size_bits for i in range(self.num_hashes)]
+
+    def _set(self, bits: bytearray, jti: str):
+        for position in self._positions(jti):
+            bits[position >> 3] |= 1 << (position & 7)
+
+    def add(self, jti: str):
+        self._set(self._bits, jti)
+        self.count += 1
+        if self._added_during_refresh is not None:
+            self._added_during_refresh.append(jti)
+
+    def might_contain(self, jti: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(jti))
+
+    async def refresh(self):
+        # Build the new filter aside; lookups keep using the current one until the swap
+        bits = bytearray(self.size_bits // 8)
+        count = 0
+        self._added_during_refresh = []
+        try:
+            cursor = db.revoked_tokens.find({"expires_at": {"$gt": datetime.utcnow()}}, {"jti": 1, "_id": 0})
+            async for revoked in cursor:
+                self._set(bits, revoked["jti"])
+                count += 1
+            # Tokens revoked on this worker while the cursor was streaming
+            for jti in self._added_during_refresh:
+                self._set(bits, jti)
+                count += 1
+            self._bits, self.count = bits, count
+        finally:
+            self._added_during_refresh = None
+        self.refreshed_at = datetime.utcnow()
+
+    async def is_revoked(self, jti: str) -> bool:
+        if not self.might_contain(jti):
+            return False
+        return await db.revoked_tokens.find_one({"jti": jti}) is not None
+
+    def stats(self) -> dict:
+        return {
+            "entries": self.count,
+            "size_bits": self.size_bits,
+            "num_hashes": self.num_hashes,
+            "refreshed_at": self.refreshed_at.isoformat() if self.refreshed_at else None
+        }
+
+token_revocation_list = TokenRevocationList()
+
+async def refresh_revocation_list_periodically():
+    """Background task picking up tokens revoked by other workers"""
+    while True:
+        try:
+            await token_revocation_list.refresh()
+        except Exception as e:
+            logger.error(f"Error refreshing token revocation list: {e}")
+        await asyncio.sleep(TOKEN_REVOCATION_REFRESH_SECONDS)
+
+credentials_exception = HTTPException(
+    status_code=status.HTTP_401_UNAUTHORIZED,
+    detail="Could not validate credentials",
+    headers={"WWW-Authenticate": "Bearer"},
+)
+
+async def decode_access_token(token: str) -> dict:
+    """Decode a JWT access token and reject revoked tokens"""
     try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
-    except JWTError:
+        payload = token_backend.decode(token)
+    except TokenError:
+        raise credentials_exception
+    
+    if payload.get("sub") is None:
+        raise credentials_exception
+    
+    jti = payload.get("jti")
+    if jti and await token_revocation_list.is_revoked(jti):
         raise credentials_exception
     
+    return payload
+
+async def resolve_user(email: str) -> User:
+    """Load a user by email through the process-local cache"""
+    cached_user = user_cache.get(email)
+    if cached_user is not None:
+        return cached_user
+    
     user = await db.users.find_one({"email": email})
     if user is None:
         raise credentials_exception
     
-    return User(
+    user_obj = User(
         id=str(user['_id']),  # Use _id from MongoDB
         name=user['name'],
         email=user['email'],
-        profile_photo=user.get('profile_photo'),
+        profile_photo=profile_photo_url(user),
+        timezone=user.get('timezone', DEFAULT_TIMEZONE),
         created_at=user['created_at']
     )
+    user_cache.set(email, user_obj)
+    
+    return user_obj
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    """Get current user from JWT token (full user)"""
+    payload = await decode_access_token(credentials.credentials)
+    return await resolve_user(payload["sub"])
+
+async def get_token_claims(credentials: HTTPAuthorizationCredentials = Depends(security)) -> TokenClaims:
+    """Get the user identity from the token alone (claims-only), without touching the users collection"""
+    payload = await decode_access_token(credentials.credentials)
+    
+    if payload.get("uid") is None:
+        # Token issued without embedded claims; fall back to the full user lookup
+        user = await resolve_user(payload["sub"])
+        return TokenClaims(id=user.id, email=user.email, name=user.name, timezone=user.timezone)
+    
+    return TokenClaims(
+        id=payload["uid"],
+        email=payload["sub"],
+        name=payload.get("name", ""),
+        profile_version=payload.get("pv", 0),
+        timezone=payload.get("tz", DEFAULT_TIMEZONE)
+    )
 
 # Auth Routes
 @api_router.post("/register", response_model=Token)
-async def register_user(user_data: UserCreate):
-    # Check if user already exists
-    existing_user = await db.users.find_one({"email": user_data.email})
-    if existing_user:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Email já está registrado"
-        )
+async def register_user(user_data: UserCreate, request: Request):
+    await auth_rate_limiter.check(client_ip(request), user_data.email)
     
-    # Create new user
+    # Create new user; the unique index on users.email rejects duplicates atomically
     user_dict = {
+        "_id": ObjectId(),
         "id": str(uuid.uuid4()),
         "name": user_data.name,
         "email": user_data.email,
-        "password": hash_password(user_data.password),
+        "password": await password_hash_pool.hash(user_data.password),
+        "timezone": user_data.timezone or DEFAULT_TIMEZONE,
         "created_at": datetime.utcnow()
     }
     
-    await db.users.insert_one(user_dict)
+    try:
+        await db.users.insert_one(user_dict)
+    except DuplicateKeyError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Email já está registrado"
+        )
     
-    # Create free trial for new user
-    await create_free_trial(user_data.email)
+    # Create free trial for new user, keyed on the same id every route uses
+    await create_free_trial(str(user_dict['_id']))
     
     # Create access token
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user_data.email}, expires_delta=access_token_expires
+        data=build_token_data(user_dict), expires_delta=access_token_expires
     )
+    refresh_token = await issue_refresh_token(user_dict['email'])
     
     user = User(
-        id=user_dict['id'],
+        id=str(user_dict['_id']),  # Use _id from MongoDB
         name=user_dict['name'],
         email=user_dict['email'],
-        profile_photo=user_dict.get('profile_photo'),
+        profile_photo=profile_photo_url(user_dict),
+        timezone=user_dict['timezone'],
         created_at=user_dict['created_at']
     )
     
     return Token(
         access_token=access_token,
         token_type="bearer",
-        user=user
+        user=user,
+        refresh_token=refresh_token
     )
 
 @api_router.post("/login", response_model=Token)
-async def login_user(user_data: UserLogin):
+async def login_user(user_data: UserLogin, request: Request, background_tasks: BackgroundTasks):
+    # Throttle before any lookup or bcrypt work
+    await auth_rate_limiter.check(client_ip(request), user_data.email)
+    
     # Find user by email
     user = await db.users.find_one({"email": user_data.email})
     if not user:
+        await auth_rate_limiter.record_failure(user_data.email)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Email ou senha incorretos"
         )
     
-    # Verify password
-    if not verify_password(user_data.password, user['password']):
+    # Verify password (invited users have none until they accept their invite)
+    if not user.get('password') or not await password_hash_pool.verify(user_data.password, user['password']):
+        await auth_rate_limiter.record_failure(user_data.email)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Email ou senha incorretos"
         )
+    auth_rate_limiter.record_success(user_data.email)
+    
+    # Upgrade a hash weaker than the current cost after the response is sent
+    if password_hash_pool.needs_rehash(user['password']):
+        background_tasks.add_task(rehash_password, user['_id'], user['password'], user_data.password)
     
     # Create access token
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user['email']}, expires_delta=access_token_expires
+        data=build_token_data(user), expires_delta=access_token_expires
     )
+    refresh_token = await issue_refresh_token(user['email'])
     
     user_obj = User(
         id=str(user['_id']),  # Use _id from MongoDB
         name=user['name'],
         email=user['email'],
-        profile_photo=user.get('profile_photo'),
+        profile_photo=profile_photo_url(user),
+        timezone=user.get('timezone', DEFAULT_TIMEZONE),
         created_at=user['created_at']
     )
     
-    return Token(
-        access_token=access_token,
-        token_type="bearer",
-        user=user_obj
+    return Token(
+        access_token=access_token,
+        token_type="bearer",
+        user=user_obj,
+        refresh_token=refresh_token
+    )
+
+async def rehash_password(user_id, old_hash: str, password: str):
+    """Re-hash a verified password at the current bcrypt cost"""
+    try:
+        new_hash = await password_hash_pool.hash(password)
+        # Only replace the hash we verified, in case the password changed meanwhile
+        await db.users.update_one(
+            {"_id": user_id, "password": old_hash},
+            {"$set": {"password": new_hash}}
+        )
+    except Exception as e:
+        logger.error(f"Error re-hashing password: {e}")
+
+@api_router.post("/token/refresh", response_model=Token)
+async def refresh_access_token(request: TokenRefreshRequest):
+    """Exchange a refresh token for a new access token, rotating the refresh token"""
+    invalid_refresh_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Sessão expirada, faça login novamente"
+    )
+    token_hash = hash_refresh_token(request.refresh_token)
+    
+    # Atomically mark the token as used so it can only be redeemed once
+    stored = await db.refresh_tokens.find_one_and_update(
+        {"token_hash": token_hash, "used": False, "expires_at": {"$gt": datetime.utcnow()}},
+        {"$set": {"used": True, "used_at": datetime.utcnow()}}
+    )
+    
+    if stored is None:
+        reused = await db.refresh_tokens.find_one({"token_hash": token_hash, "used": True})
+        if reused:
+            # A rotated token was presented again: assume it leaked and revoke the whole family
+            await db.refresh_tokens.delete_many({"family_id": reused["family_id"]})
+            logger.warning(f"Refresh token reuse detected for {reused['user_email']}")
+        raise invalid_refresh_exception
+    
+    user = await db.users.find_one({"email": stored["user_email"]})
+    if user is None:
+        raise invalid_refresh_exception
+    
+    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    access_token = create_access_token(
+        data=build_token_data(user), expires_delta=access_token_expires
+    )
+    refresh_token = await issue_refresh_token(user['email'], stored["family_id"])
+    
+    user_obj = User(
+        id=str(user['_id']),  # Use _id from MongoDB
+        name=user['name'],
+        email=user['email'],
+        profile_photo=profile_photo_url(user),
+        timezone=user.get('timezone', DEFAULT_TIMEZONE),
+        created_at=user['created_at']
+    )
+    
+    return Token(
+        access_token=access_token,
+        token_type="bearer",
+        user=user_obj,
+        refresh_token=refresh_token
+    )
+
+class InviteAccept(BaseModel):
+    email: EmailStr
+    invite_secret: str
+    password: str
+    confirm_password: str
+    
+    @validator('password')
+    def validate_password(cls, v):
+        if len(v) < 6:
+            raise ValueError('Senha deve ter pelo menos 6 caracteres')
+        return v
+    
+    @validator('confirm_password')
+    def passwords_match(cls, v, values, **kwargs):
+        if 'password' in values and v != values['password']:
+            raise ValueError('Senhas não coincidem')
+        return v
+
+@api_router.post("/invite/accept", response_model=Token)
+async def accept_invite(invite_data: InviteAccept, request: Request):
+    """Let a provisioned employee set their password using the invite secret"""
+    await auth_rate_limiter.check(client_ip(request), invite_data.email)
+    
+    invite_filter = {
+        "email": invite_data.email.lower(),
+        "invite_secret_hash": hash_refresh_token(invite_data.invite_secret)
+    }
+    invalid_invite_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Convite inválido ou já utilizado"
+    )
+    
+    # Check the invite with a cheap lookup before spending a bcrypt hash on it
+    if await db.users.find_one(invite_filter, {"_id": 1}) is None:
+        await auth_rate_limiter.record_failure(invite_data.email)
+        raise invalid_invite_exception
+    
+    password_hash = await password_hash_pool.hash(invite_data.password)
+    
+    user = await db.users.find_one_and_update(
+        invite_filter,
+        {
+            "$set": {"password": password_hash, "invite_accepted_at": datetime.utcnow()},
+            "$unset": {"invite_secret_hash": ""}
+        },
+        return_document=ReturnDocument.AFTER
+    )
+    if user is None:
+        raise invalid_invite_exception
+    user_cache.invalidate(user['email'])
+    
+    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    access_token = create_access_token(
+        data=build_token_data(user), expires_delta=access_token_expires
+    )
+    refresh_token = await issue_refresh_token(user['email'])
+    
+    user_obj = User(
+        id=str(user['_id']),  # Use _id from MongoDB
+        name=user['name'],
+        email=user['email'],
+        profile_photo=profile_photo_url(user),
+        timezone=user.get('timezone', DEFAULT_TIMEZONE),
+        created_at=user['created_at']
+    )
+    
+    return Token(
+        access_token=access_token,
+        token_type="bearer",
+        user=user_obj,
+        refresh_token=refresh_token
+    )
+
+@api_router.get("/me", response_model=User)
+async def get_current_user_info(current_user: User = Depends(get_current_user)):
+    return current_user
+
+@api_router.post("/logout")
+async def logout_user(
+    logout_data: Optional[LogoutRequest] = None,
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Revoke the presented access token and the session's refresh token family"""
+    payload = await decode_access_token(credentials.credentials)
+    
+    jti = payload.get("jti")
+    if jti:
+        await db.revoked_tokens.update_one(
+            {"jti": jti},
+            {"$setOnInsert": {
+                "jti": jti,
+                "user_email": payload["sub"],
+                "expires_at": datetime.utcfromtimestamp(payload["exp"]),
+                "revoked_at": datetime.utcnow()
+            }},
+            upsert=True
+        )
+        token_revocation_list.add(jti)
+    
+    if logout_data and logout_data.refresh_token:
+        stored = await db.refresh_tokens.find_one(
+            {"token_hash": hash_refresh_token(logout_data.refresh_token), "user_email": payload["sub"]},
+            {"family_id": 1}
+        )
+        if stored:
+            # Every rotation of this session's refresh token stops being redeemable
+            await db.refresh_tokens.delete_many({"family_id": stored["family_id"]})
+    
+    user_cache.invalidate(payload["sub"])
+    
+    return {"message": "Logout realizado com sucesso"}
+
+@api_router.put("/profile/photo", response_model=User)
+async def update_profile_photo(photo_data: ProfilePhotoUpdate, current_user: User = Depends(get_current_user)):
+    # Store the image in the blob store and keep only its hash on the user document
+    photo_hash = await store_profile_photo(photo_data.profile_photo)
+    
+    updated_user = await db.users.find_one_and_update(
+        {"email": current_user.email},
+        {
+            "$set": {"profile_photo_hash": photo_hash},
+            "$unset": {"profile_photo": ""},
+            "$inc": {"profile_version": 1}
+        },
+        return_document=ReturnDocument.AFTER
+    )
+    user_cache.invalidate(current_user.email)
+    
+    return User(
+        id=str(updated_user['_id']),  # Use _id from MongoDB
+        name=updated_user['name'],
+        email=updated_user['email'],
+        profile_photo=profile_photo_url(updated_user),
+        timezone=updated_user.get('timezone', DEFAULT_TIMEZONE),
+        created_at=updated_user['created_at']
+    )
+
+@api_router.put("/profile/timezone", response_model=Token)
+async def update_timezone(timezone_data: TimezoneUpdate, current_user: User = Depends(get_current_user)):
+    """Set the zone that decides when the user's day starts; returns a new access token carrying it"""
+    updated_user = await db.users.find_one_and_update(
+        {"email": current_user.email},
+        {"$set": {"timezone": timezone_data.timezone}, "$inc": {"profile_version": 1}},
+        return_document=ReturnDocument.AFTER
+    )
+    user_cache.invalidate(current_user.email)
+    
+    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    access_token = create_access_token(
+        data=build_token_data(updated_user), expires_delta=access_token_expires
+    )
+    
+    return Token(
+        access_token=access_token,
+        token_type="bearer",
+        user=User(
+            id=str(updated_user['_id']),  # Use _id from MongoDB
+            name=updated_user['name'],
+            email=updated_user['email'],
+            profile_photo=profile_photo_url(updated_user),
+            timezone=updated_user['timezone'],
+            created_at=updated_user['created_at']
+        )
+    )
+
+@api_router.get("/profile/photo/{photo_hash}")
+async def get_profile_photo(photo_hash: str, request: Request, size: Optional[str] = None):
+    """Serve a stored profile photo (or its thumbnail with ?size=thumb) with strong ETags and range support"""
+    if not re.fullmatch(r'[0-9a-f]{64}', photo_hash):
+        raise HTTPException(status_code=404, detail="Foto não encontrada")
+    
+    filename = f"{photo_hash}_thumb" if size == "thumb" else photo_hash
+    etag = f'"{filename}"'
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        # Content-addressed: the bytes behind a URL never change
+        "Cache-Control": "public, max-age=31536000, immutable"
+    }
+    
+    if request.headers.get("If-None-Match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
+    try:
+        grid_out = await profile_photo_bucket.open_download_stream_by_name(filename)
+    except NoFile:
+        raise HTTPException(status_code=404, detail="Foto não encontrada")
+    
+    media_type = (grid_out.metadata or {}).get("content_type", "application/octet-stream")
+    length = grid_out.length
+    
+    range_header = request.headers.get("Range")
+    if range_header and request.headers.get("If-Range", etag) == etag:
+        byte_range = parse_range_header(range_header, length)
+        if byte_range is None:
+            return Response(
+                status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                headers={**headers, "Content-Range": f"bytes */{length}"}
+            )
+        start, end = byte_range
+        grid_out.seek(start)
+        content = await grid_out.read(end - start + 1)
+        return Response(
+            content=content,
+            status_code=status.HTTP_206_PARTIAL_CONTENT,
+            media_type=media_type,
+            headers={**headers, "Content-Range": f"bytes {start}-{end}/{length}"}
+        )
+    
+    async def stream_photo():
+        while True:
+            chunk = await grid_out.readchunk()
+            if not chunk:
+                break
+            yield chunk
+    
+    return StreamingResponse(
+        stream_photo(),
+        media_type=media_type,
+        headers={**headers, "Content-Length": str(length)}
+    )
+
+# Delta sync: every synced write stamps its document with the next value of a per-user counter
+async def next_sync_version(user_id: str, count: int = 1) -> int:
+    """Reserve `count` consecutive sync versions for a user; returns the last one.
+
+    The reservation is remembered with its time so pulls can hold the cursor
+    before versions whose documents may not be written yet.
+    """
+    version = {"$add": [{"$ifNull": ["$version", 0]}, count]}
+    counter = await db.sync_versions.find_one_and_update(
+        {"user_id": user_id},
+        [{"$set": {
+            "version": version,
+            "reservations": {"$slice": [
+                {"$concatArrays": [
+                    {"$ifNull": ["$reservations", []]},
+                    [{"first": {"$subtract": [version, count - 1]}, "at": datetime.utcnow()}]
+                ]},
+                -SYNC_RESERVATION_HISTORY
+            ]}
+        }}],
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return counter["version"]
+
+def settled_sync_version(counter: Optional[dict]) -> int:
+    """Highest version below every reservation whose write may still be in flight"""
+    if not counter:
+        return 0
+    recent = datetime.utcnow() - timedelta(seconds=SYNC_WRITE_GRACE_SECONDS)
+    in_flight = [reservation["first"] for reservation in counter.get("reservations", []) if reservation["at"] > recent]
+    return min([counter["version"], *(first - 1 for first in in_flight)])
+
+# Local days: mood, gratitude and missions are keyed by the calendar day in the user's zone
+UTC_ZONE = ZoneInfo("UTC")
+
+@lru_cache(maxsize=1024)
+def user_zone(tz_name: str) -> ZoneInfo:
+    try:
+        return ZoneInfo(tz_name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return ZoneInfo(DEFAULT_TIMEZONE)
+
+def local_datetime(moment: datetime, tz_name: str = DEFAULT_TIMEZONE) -> datetime:
+    """Naive UTC `moment` as naive wall-clock time in the given zone"""
+    return moment.replace(tzinfo=UTC_ZONE).astimezone(user_zone(tz_name)).replace(tzinfo=None)
+
+def local_day_key(moment: datetime, tz_name: str = DEFAULT_TIMEZONE) -> str:
+    """Calendar day ("YYYY-MM-DD") that `moment` falls on in the given zone"""
+    return local_datetime(moment, tz_name).date().isoformat()
+
+def day_from_key(day_key: str):
+    return datetime.strptime(day_key, "%Y-%m-%d").date()
+
+# Mood storage
+
+def mood_month_key(moment: datetime) -> str:
+    """Month bucket a mood entry belongs to ("YYYY-MM")"""
+    return moment.strftime("%Y-%m")
+
+# Buckets are keyed by local month; a day either side of a UTC moment covers every zone offset
+def mood_month_floor(moment: datetime) -> str:
+    """Earliest bucket month an entry stored at UTC `moment` can be in"""
+    return mood_month_key(moment - timedelta(days=1))
+
+def mood_month_ceiling(moment: datetime) -> str:
+    """Latest bucket month an entry stored at UTC `moment` can be in"""
+    return mood_month_key(moment + timedelta(days=1))
+
+MOOD_RESPONSE_PROJECTION = {
+    "_id": 0, "id": 1, "mood_level": 1, "mood_emoji": 1, "description": 1, "date": 1, "day_key": 1, "sync_version": 1
+}
+
+# Bucket month plus the entry's day of month, zero-padded
+MOOD_BUCKET_DAY_KEY = {"$concat": [
+    "$month",
+    {"$cond": [{"$lt": ["$entries.day", 10]}, "-0", "-"]},
+    {"$toString": "$entries.day"}
+]}
+
+# Unwinds monthly buckets into the same shape as humor_diario documents
+MOOD_BUCKET_UNWIND = [
+    {"$unwind": "$entries"},
+    {"$project": {
+        "_id": 0,
+        "id": "$entries.id",
+        "mood_level": "$entries.level",
+        "mood_emoji": {"$arrayElemAt": [MOOD_EMOJIS, "$entries.emoji_code"]},
+        "description": "$entries.description",
+        "date": "$entries.date",
+        "sync_version": "$entries.sync_version",
+        "day_key": MOOD_BUCKET_DAY_KEY
+    }}
+]
+
+def bucket_entry_to_mood(entry: dict, month: str) -> dict:
+    return {
+        "id": entry["id"],
+        "mood_level": entry["level"],
+        "mood_emoji": MOOD_EMOJIS[entry["emoji_code"]],
+        "description": entry.get("description"),
+        "date": entry["date"],
+        "day_key": f"{month}-{entry['day']:02d}"
+    }
+
+async def save_mood_entry(user_id: str, mood_data: MoodCreate, now: datetime, tz_name: str = DEFAULT_TIMEZONE) -> tuple:
+    """Create or replace the user's mood entry for the local day of `now`.
+
+    Returns the entry in document shape and the level it replaced (None for a new day).
+    """
+    local_now = local_datetime(now, tz_name)
+    day_key = local_now.date().isoformat()
+    sync_version = await next_sync_version(user_id)
+    fields = {
+        "mood_level": mood_data.mood_level,
+        "mood_emoji": mood_data.mood_emoji,
+        "description": mood_data.description,
+        "date": now,
+        "day_key": day_key,
+        "sync_version": sync_version
+    }
+    
+    if MOOD_STORAGE_MODE != "buckets":
+        # One entry per user and day: a single upsert on the unique (user_id, day_key) index
+        new_id = str(uuid.uuid4())
+        previous = await db.humor_diario.find_one_and_update(
+            {"user_id": user_id, "day_key": day_key},
+            {"$set": fields, "$setOnInsert": {"id": new_id}},
+            upsert=True,
+            return_document=ReturnDocument.BEFORE,
+            projection={"_id": 0, "id": 1, "mood_level": 1}
+        )
+        if previous:
+            return {"id": previous["id"], **fields}, previous["mood_level"]
+        return {"id": new_id, **fields}, None
+    
+    month = mood_month_key(local_now)
+    day = local_now.day
+    bucket_fields = {
+        "level": mood_data.mood_level,
+        "emoji_code": MOOD_EMOJIS.index(mood_data.mood_emoji),
+        "description": mood_data.description,
+        "date": now,
+        "sync_version": sync_version
+    }
+    
+    # Day already logged: overwrite it in place, keeping its id
+    bucket = await db.humor_diario_buckets.find_one_and_update(
+        {"user_id": user_id, "month": month, "entries.day": day},
+        {"$set": {f"entries.$.{name}": value for name, value in bucket_fields.items()}},
+        projection={"entries.$": 1},
+        return_document=ReturnDocument.BEFORE
+    )
+    if bucket:
+        previous = bucket["entries"][0]
+        return {"id": previous["id"], **fields}, previous["level"]
+    
+    entry = {"day": day, "id": str(uuid.uuid4()), **bucket_fields}
+    try:
+        await db.humor_diario_buckets.update_one(
+            {"user_id": user_id, "month": month, "entries.day": {"$ne": day}},
+            {"$push": {"entries": entry}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # A concurrent request logged this day first; apply ours on top of it
+        return await save_mood_entry(user_id, mood_data, now, tz_name)
+    return bucket_entry_to_mood(entry, month), None
+
+# Mood rollups: running count/sum/sum of squares and a level histogram per
+# user and ISO week / calendar month, so trends never rescan raw entries
+MOOD_ROLLUP_PERIODS = ("week", "month")
+
+def mood_week_key(moment) -> str:
+    """ISO week a mood entry belongs to ("YYYY-Www")"""
+    year, week, _ = moment.isocalendar()
+    return f"{year}-W{week:02d}"
+
+def mood_rollup_keys(day) -> dict:
+    return {"week": mood_week_key(day), "month": mood_month_key(day)}
+
+def mood_entry_day(mood: dict):
+    """Local day of an entry; legacy entries without a day_key fall back to their UTC date"""
+    return day_from_key(mood["day_key"]) if mood.get("day_key") else mood["date"].date()
+
+def mood_rollup_delta(level: int, sign: int = 1) -> dict:
+    """$inc document adding (sign=1) or removing (sign=-1) one level"""
+    return {
+        "count": sign,
+        "sum": sign * level,
+        "sum_sq": sign * level * level,
+        f"histogram.{level}": sign
+    }
+
+async def update_mood_rollups(user_id: str, day_key: str, new_level: int, previous_level: Optional[int] = None):
+    """Fold a mood write into the week and month rollups, replacing `previous_level` if the day was already logged"""
+    if new_level == previous_level:
+        return
+    
+    delta = mood_rollup_delta(new_level)
+    if previous_level is not None:
+        for field, value in mood_rollup_delta(previous_level, -1).items():
+            delta[field] = delta.get(field, 0) + value
+    
+    await db.mood_rollups.bulk_write([
+        UpdateOne(
+            {"user_id": user_id, "period": period, "key": key},
+            {"$inc": delta},
+            upsert=True
+        )
+        for period, key in mood_rollup_keys(day_from_key(day_key)).items()
+    ], ordered=False)
+
+def mood_rollup_summary(rollup: dict) -> dict:
+    count = rollup.get("count", 0)
+    histogram = {str(level): rollup.get("histogram", {}).get(str(level), 0) for level in range(1, 6)}
+    # Min/max come from the histogram so they stay right when a day's level is replaced
+    logged_levels = [int(level) for level, hits in histogram.items() if hits > 0]
+    average = rollup["sum"] / count if count else None
+    return {
+        "period": rollup["period"],
+        "key": rollup["key"],
+        "count": count,
+        "average": round(average, 2) if count else None,
+        "variance": round(max(rollup["sum_sq"] / count - average * average, 0.0), 3) if count else None,
+        "min": min(logged_levels) if logged_levels else None,
+        "max": max(logged_levels) if logged_levels else None,
+        "histogram": histogram
+    }
+
+def build_mood_rollups(user_id: str, entries: List[dict]) -> List[dict]:
+    """Rollup documents for a user's full set of mood entries (used by the rebuild command)"""
+    rollups = {}
+    for entry in entries:
+        for period, key in mood_rollup_keys(mood_entry_day(entry)).items():
+            rollup = rollups.setdefault((period, key), {
+                "user_id": user_id, "period": period, "key": key,
+                "count": 0, "sum": 0, "sum_sq": 0, "histogram": {}
+            })
+            level = entry["mood_level"]
+            rollup["count"] += 1
+            rollup["sum"] += level
+            rollup["sum_sq"] += level * level
+            rollup["histogram"][str(level)] = rollup["histogram"].get(str(level), 0) + 1
+    return list(rollups.values())
+
+async def rebuild_user_mood_rollups(user_id: str) -> int:
+    """Recompute a user's rollups from their stored entries; returns how many were written"""
+    entries = await find_mood_entries(user_id, sort_direction=1)
+    rollups = build_mood_rollups(user_id, entries)
+    if rollups:
+        await db.mood_rollups.bulk_write([
+            ReplaceOne({"user_id": user_id, "period": rollup["period"], "key": rollup["key"]}, rollup, upsert=True)
+            for rollup in rollups
+        ], ordered=False)
+    # Drop periods that no longer have any entries
+    for period in MOOD_ROLLUP_PERIODS:
+        await db.mood_rollups.delete_many({
+            "user_id": user_id,
+            "period": period,
+            "key": {"$nin": [rollup["key"] for rollup in rollups if rollup["period"] == period]}
+        })
+    return len(rollups)
+
+def mood_bucket_filter(user_id: str, month_from: Optional[str] = None, month_to: Optional[str] = None) -> dict:
+    bucket_match = {"user_id": user_id}
+    if month_from or month_to:
+        bucket_match["month"] = {}
+        if month_from:
+            bucket_match["month"]["$gte"] = month_from
+        if month_to:
+            bucket_match["month"]["$lte"] = month_to
+    return bucket_match
+
+def mood_entries_cursor(
+    user_id: str,
+    match: Optional[dict] = None,
+    sort_direction: int = -1,
+    limit: Optional[int] = None,
+    month_from: Optional[str] = None,
+    month_to: Optional[str] = None,
+    sort_field: str = "date"
+):
+    """Cursor over mood entries in document shape, whatever the storage mode.
+
+    `match` filters on entry fields (date, id, sync_version). month_from/month_to
+    ("YYYY-MM", inclusive) let bucket storage skip whole months; they must
+    cover every date `match` can select. Bucket storage also skips buckets
+    with no entry matching `match`.
+    """
+    sort = [(sort_field, sort_direction), ("id", sort_direction)]
+    
+    if MOOD_STORAGE_MODE != "buckets":
+        cursor = db.humor_diario.find({"user_id": user_id, **(match or {})}, MOOD_RESPONSE_PROJECTION).sort(sort)
+        if limit:
+            cursor = cursor.limit(limit)
+        return cursor
+    
+    bucket_match = mood_bucket_filter(user_id, month_from, month_to)
+    if match:
+        # Entry fields keep their names inside buckets, so `match` applies to them as is
+        bucket_match["entries"] = {"$elemMatch": match}
+    
+    pipeline = [
+        {"$match": bucket_match},
+        {"$sort": {"month": sort_direction}},
+        *MOOD_BUCKET_UNWIND
+    ]
+    if match:
+        pipeline.append({"$match": match})
+    pipeline.append({"$sort": dict(sort)})
+    if limit:
+        pipeline.append({"$limit": limit})
+    return db.humor_diario_buckets.aggregate(pipeline)
+
+async def bound_mood_bucket_months(
+    user_id: str,
+    match: Optional[dict],
+    sort_direction: int,
+    limit: int,
+    month_from: Optional[str],
+    month_to: Optional[str]
+) -> tuple:
+    """Narrow a page's month range to the buckets that can fill its `limit`.
+
+    Walks the user's buckets from the page's start, reading only their
+    sizes, so a page costs the same however much history lies beyond it.
+    The two months nearest a cursor may be partly excluded by `match` and
+    are not counted.
+    """
+    cursor = db.humor_diario_buckets.aggregate([
+        {"$match": mood_bucket_filter(user_id, month_from, month_to)},
+        {"$sort": {"month": sort_direction}},
+        {"$project": {"_id": 0, "month": 1, "size": {"$size": "$entries"}}}
+    ], batchSize=12)
+    uncounted = 2 if match else 0
+    collected = 0
+    async for bucket in cursor:
+        if uncounted:
+            uncounted -= 1
+        else:
+            collected += bucket["size"]
+        if collected >= limit:
+            if sort_direction == -1:
+                month_from = bucket["month"]
+            else:
+                month_to = bucket["month"]
+            break
+    await cursor.close()
+    return month_from, month_to
+
+async def find_mood_entries(
+    user_id: str,
+    match: Optional[dict] = None,
+    sort_direction: int = -1,
+    limit: Optional[int] = None,
+    month_from: Optional[str] = None,
+    month_to: Optional[str] = None,
+    sort_field: str = "date"
+) -> List[dict]:
+    """Mood entries as a list; see mood_entries_cursor for the arguments"""
+    if MOOD_STORAGE_MODE == "buckets" and limit and sort_field == "date":
+        month_from, month_to = await bound_mood_bucket_months(
+            user_id, match, sort_direction, limit, month_from, month_to
+        )
+    cursor = mood_entries_cursor(user_id, match, sort_direction, limit, month_from, month_to, sort_field)
+    return await cursor.to_list(limit)
+
+def mood_levels_cursor(user_ids: List[str], since: datetime):
+    """Cursor over (user_id, mood_level, date, day_key) of several users' entries since a date, for batch jobs"""
+    if MOOD_STORAGE_MODE != "buckets":
+        return db.humor_diario.find(
+            {"user_id": {"$in": user_ids}, "date": {"$gte": since}},
+            {"_id": 0, "user_id": 1, "mood_level": 1, "date": 1, "day_key": 1}
+        )
+    
+    return db.humor_diario_buckets.aggregate([
+        {"$match": {"user_id": {"$in": user_ids}, "month": {"$gte": mood_month_floor(since)}}},
+        {"$unwind": "$entries"},
+        {"$match": {"entries.date": {"$gte": since}}},
+        {"$project": {
+            "_id": 0,
+            "user_id": 1,
+            "mood_level": "$entries.level",
+            "date": "$entries.date",
+            "day_key": MOOD_BUCKET_DAY_KEY
+        }}
+    ])
+
+async def find_mood_for_day(user_id: str, day_key: str) -> Optional[dict]:
+    """Exact-match lookup of the user's entry for a local day, whatever the storage mode"""
+    if MOOD_STORAGE_MODE != "buckets":
+        return await db.humor_diario.find_one({"user_id": user_id, "day_key": day_key}, MOOD_RESPONSE_PROJECTION)
+    
+    month = day_key[:7]
+    bucket = await db.humor_diario_buckets.find_one(
+        {"user_id": user_id, "month": month, "entries.day": int(day_key[8:])},
+        {"entries.$": 1}
+    )
+    return bucket_entry_to_mood(bucket["entries"][0], month) if bucket else None
+
+def mood_response(mood: dict) -> MoodResponse:
+    return MoodResponse(
+        id=mood["id"],
+        mood_level=mood["mood_level"],
+        mood_emoji=mood["mood_emoji"],
+        description=mood.get("description"),
+        date=mood["date"]
+    )
+
+# Mood Routes
+@api_router.post("/mood", response_model=MoodResponse)
+async def create_mood_entry(mood_data: MoodCreate, current_user: TokenClaims = Depends(get_token_claims)):
+    return await record_mood_entry(current_user, mood_data, datetime.utcnow())
+
+async def record_mood_entry(current_user: TokenClaims, mood_data: MoodCreate, moment: datetime) -> MoodResponse:
+    """Save a mood entry for the local day of `moment` and keep rollups and caches in step"""
+    mood_entry, previous_level = await save_mood_entry(current_user.id, mood_data, moment, current_user.timezone)
+    await update_mood_rollups(current_user.id, mood_entry["day_key"], mood_data.mood_level, previous_level)
+    invalidate_mood_caches(current_user.id)
+    return mood_response(mood_entry)
+
+def encode_mood_cursor(mood: dict) -> str:
+    """Opaque continuation token for the (date, id) keyset"""
+    raw = json.dumps([mood["date"].isoformat(), mood["id"]]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip("=")
+
+def decode_mood_cursor(cursor: str) -> tuple:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        date_str, mood_id = json.loads(raw)
+        return datetime.fromisoformat(date_str), mood_id
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+@api_router.get("/mood", response_model=List[MoodResponse])
+async def get_mood_history(
+    response: Response,
+    limit: int = 100,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    current_user: TokenClaims = Depends(get_token_claims)
+):
+    """Mood history, newest first, paginated on (date, id).
+
+    Pass the X-Next-Cursor header value as `before` for older entries, or
+    X-Prev-Cursor as `after` for newer ones.
+    """
+    if before and after:
+        raise HTTPException(status_code=400, detail="Use apenas before ou after")
+    limit = max(1, min(limit, 500))
+    
+    match = None
+    month_from = month_to = None
+    sort_direction = -1
+    if before:
+        cursor_date, cursor_id = decode_mood_cursor(before)
+        match = {"$or": [
+            {"date": {"$lt": cursor_date}},
+            {"date": cursor_date, "id": {"$lt": cursor_id}}
+        ]}
+        month_to = mood_month_ceiling(cursor_date)
+    elif after:
+        cursor_date, cursor_id = decode_mood_cursor(after)
+        match = {"$or": [
+            {"date": {"$gt": cursor_date}},
+            {"date": cursor_date, "id": {"$gt": cursor_id}}
+        ]}
+        month_from = mood_month_floor(cursor_date)
+        # Walk forward from the cursor, then flip back to newest-first
+        sort_direction = 1
+    
+    mood_entries = await find_mood_entries(
+        current_user.id, match, sort_direction, limit + 1, month_from, month_to
+    )
+    
+    has_more = len(mood_entries) > limit
+    mood_entries = mood_entries[:limit]
+    if sort_direction == 1:
+        mood_entries.reverse()
+    
+    if mood_entries:
+        # X-Next-Cursor pages towards older entries, X-Prev-Cursor towards newer ones
+        if (has_more and sort_direction == -1) or after:
+            response.headers["X-Next-Cursor"] = encode_mood_cursor(mood_entries[-1])
+        if before or (has_more and sort_direction == 1):
+            response.headers["X-Prev-Cursor"] = encode_mood_cursor(mood_entries[0])
+    
+    return [mood_response(mood) for mood in mood_entries]
+
+@api_router.get("/mood/today", response_model=Optional[MoodResponse])
+async def get_today_mood(current_user: TokenClaims = Depends(get_token_claims)):
+    today_key = local_day_key(datetime.utcnow(), current_user.timezone)
+    mood_entry = await find_mood_for_day(current_user.id, today_key)
+    
+    if mood_entry:
+        return mood_response(mood_entry)
+    
+    return None
+
+@api_router.get("/mood/week", response_model=List[MoodResponse])
+async def get_week_mood(current_user: TokenClaims = Depends(get_token_claims)):
+    # Get mood entries from the last 7 days
+    seven_days_ago = datetime.utcnow() - timedelta(days=7)
+    
+    mood_entries = await find_mood_entries(
+        current_user.id,
+        {"date": {"$gte": seven_days_ago}},
+        sort_direction=1,  # Sort ascending (oldest first)
+        limit=7,
+        month_from=mood_month_floor(seven_days_ago)
+    )
+    
+    return [mood_response(mood) for mood in mood_entries]
+
+WEEKDAY_NAMES = ["segunda", "terça", "quarta", "quinta", "sexta", "sábado", "domingo"]
+
+def compute_mood_analytics(entries: List[dict], start_day, end_day, window: int) -> dict:
+    """Summarise mood entries between start_day and end_day (inclusive) on a daily grid"""
+    num_days = (end_day - start_day).days + 1
+    levels = np.full(num_days, np.nan)
+    for entry in entries:
+        offset = (mood_entry_day(entry) - start_day).days
+        if 0 <= offset < num_days:
+            levels[offset] = entry["mood_level"]
+    
+    logged = ~np.isnan(levels)
+    values = levels[logged]
+    days = [start_day + timedelta(days=offset) for offset in range(num_days)]
+    
+    summary = {
+        "start_date": start_day.isoformat(),
+        "end_date": end_day.isoformat(),
+        "days_logged": int(logged.sum()),
+        "average": None,
+        "variance": None,
+        "trend_slope": None,
+        "trend": "stable",
+        "recent_vs_older": "stable",
+        "distribution": {str(level): int((values == level).sum()) for level in range(1, 6)},
+        "best_weekday": None,
+        "worst_weekday": None,
+        "current_streak": 0,
+        "longest_streak": 0,
+        "points": [
+            {"date": day.isoformat(), "mood_level": int(levels[offset])}
+            for offset, day in enumerate(days) if logged[offset]
+        ],
+        "moving_average": []
+    }
+    if values.size == 0:
+        return summary
+    
+    summary["average"] = round(float(values.mean()), 2)
+    summary["variance"] = round(float(values.var()), 3)
+    
+    # Least-squares slope in mood levels per day
+    if values.size >= 2:
+        slope = float(np.polyfit(np.flatnonzero(logged), values, 1)[0])
+        summary["trend_slope"] = round(slope, 4)
+        # Call it a trend when the fit moves at least half a level across the window
+        if slope * num_days > 0.5:
+            summary["trend"] = "improving"
+        elif slope * num_days < -0.5:
+            summary["trend"] = "declining"
+        
+        # Same rule the app used: newest three vs oldest three entries
+        recent_avg = values[-3:].mean()
+        older_avg = values[:3].mean()
+        if recent_avg > older_avg + 0.5:
+            summary["recent_vs_older"] = "improving"
+        elif recent_avg < older_avg - 0.5:
+            summary["recent_vs_older"] = "declining"
+    
+    # Trailing moving average over logged days within each window of calendar days
+    filled = np.where(logged, levels, 0.0)
+    sums = np.convolve(filled, np.ones(window), mode="full")[:num_days]
+    counts = np.convolve(logged.astype(float), np.ones(window), mode="full")[:num_days]
+    summary["moving_average"] = [
+        {"date": days[offset].isoformat(), "value": round(float(sums[offset] / counts[offset]), 2)}
+        for offset in range(num_days) if logged[offset]
+    ]
+    
+    weekdays = np.array([day.weekday() for day in days])[logged]
+    weekday_means = {
+        weekday: float(values[weekdays == weekday].mean())
+        for weekday in np.unique(weekdays)
+    }
+    summary["best_weekday"] = WEEKDAY_NAMES[max(weekday_means, key=weekday_means.get)]
+    summary["worst_weekday"] = WEEKDAY_NAMES[min(weekday_means, key=weekday_means.get)]
+    
+    # Streaks of consecutive logged days; the current one may end today or yesterday
+    longest = run = 0
+    for is_logged in logged:
+        run = run + 1 if is_logged else 0
+        longest = max(longest, run)
+    summary["longest_streak"] = longest
+    tail = logged if logged[-1] else logged[:-1]
+    current = 0
+    for is_logged in tail[::-1]:
+        if not is_logged:
+            break
+        current += 1
+    summary["current_streak"] = current
+    
+    return summary
+
+@api_router.get("/mood/analytics")
+async def get_mood_analytics(
+    days: int = 30,
+    window: int = 7,
+    current_user: TokenClaims = Depends(get_token_claims)
+):
+    """Mood summary for the emotional progress screen over the last `days` days"""
+    days = max(1, min(days, 3660))
+    window = max(1, min(window, days))
+    
+    end_day = local_datetime(datetime.utcnow(), current_user.timezone).date()
+    cache_key = mood_cache_key(current_user.id, "analytics", end_day.isoformat(), days, window)
+    cached = mood_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    
+    start_day = end_day - timedelta(days=days - 1)
+    # One day of slack covers any zone offset; entries outside the grid are ignored
+    start = datetime.combine(start_day - timedelta(days=1), datetime.min.time())
+    entries = await find_mood_entries(
+        current_user.id,
+        {"date": {"$gte": start}},
+        sort_direction=1,
+        month_from=mood_month_floor(start)
+    )
+    
+    summary = compute_mood_analytics(entries, start_day, end_day, window)
+    mood_cache.set(cache_key, summary)
+    return summary
+
+@api_router.get("/mood/trends")
+async def get_mood_trends(
+    period: str = "week",
+    limit: int = 12,
+    current_user: TokenClaims = Depends(get_token_claims)
+):
+    """Per-week or per-month mood summaries, oldest first, read from the rollups"""
+    if period not in MOOD_ROLLUP_PERIODS:
+        raise HTTPException(status_code=400, detail="Período inválido")
+    limit = max(1, min(limit, 120))
+    
+    rollups = await db.mood_rollups.find(
+        {"user_id": current_user.id, "period": period, "count": {"$gt": 0}},
+        {"_id": 0}
+    ).sort("key", -1).limit(limit).to_list(limit)
+    
+    return [mood_rollup_summary(rollup) for rollup in reversed(rollups)]
+
+def build_mood_heatmap(entries: List[dict], year: int) -> dict:
+    """Pack a year of entries into one byte per day (level, 0 = not logged) and a bitmap of logged days"""
+    levels = np.zeros(366, dtype=np.uint8)
+    for entry in entries:
+        day = mood_entry_day(entry)
+        if day.year == year:
+            levels[day.timetuple().tm_yday - 1] = entry["mood_level"]
+    
+    logged = levels > 0
+    return {
+        "year": year,
+        "days": (datetime(year + 1, 1, 1) - datetime(year, 1, 1)).days,
+        "days_logged": int(logged.sum()),
+        "levels": base64.b64encode(levels.tobytes()).decode('ascii'),
+        # Bit i (least significant first within each byte) is set when day i of the year was logged
+        "logged": base64.b64encode(np.packbits(logged, bitorder="little").tobytes()).decode('ascii')
+    }
+
+@api_router.get("/mood/heatmap")
+async def get_mood_heatmap(year: Optional[int] = None, current_user: TokenClaims = Depends(get_token_claims)):
+    """A year of daily mood levels for the calendar view; byte i of `levels` is day i + 1 of the year"""
+    if year is None:
+        year = local_datetime(datetime.utcnow(), current_user.timezone).year
+    if not 2000 <= year <= 2100:
+        raise HTTPException(status_code=400, detail="Ano inválido")
+    
+    cache_key = mood_cache_key(current_user.id, "heatmap", year)
+    cached = mood_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    
+    # One range query over the year; a day of slack either side covers any zone offset
+    entries = await find_mood_entries(
+        current_user.id,
+        {"date": {"$gte": datetime(year - 1, 12, 31), "$lt": datetime(year + 1, 1, 2)}},
+        sort_direction=1,
+        month_from=f"{year - 1}-12",
+        month_to=f"{year + 1}-01"
     )
+    
+    heatmap = build_mood_heatmap(entries, year)
+    mood_cache.set(cache_key, heatmap)
+    return heatmap
 
-@api_router.get("/me", response_model=User)
-async def get_current_user_info(current_user: User = Depends(get_current_user)):
-    return current_user
+@api_router.get("/insights")
+async def get_insights(current_user: TokenClaims = Depends(get_token_claims)):
+    """Latest activity/mood correlations computed by the nightly insights job"""
+    insight = await db.insights.find_one({"user_id": current_user.id}, {"_id": 0, "user_id": 0})
+    if insight is None:
+        return {"computed_at": None, "correlations": [], "highlights": []}
+    return insight
 
-@api_router.put("/profile/photo", response_model=User)
-async def update_profile_photo(photo_data: ProfilePhotoUpdate, current_user: User = Depends(get_current_user)):
-    # Update user profile photo in database
-    await db.users.update_one(
-        {"id": current_user.id},
-        {"$set": {"profile_photo": photo_data.profile_photo}}
-    )
+MOOD_EXPORT_COLUMNS = ["id", "date", "day_key", "mood_level", "mood_emoji", "description"]
+MOOD_EXPORT_FLUSH_ROWS = 500
+
+@api_router.get("/mood/export")
+async def export_mood_history(format: str = "ndjson", current_user: TokenClaims = Depends(get_token_claims)):
+    """Stream the user's whole mood history, oldest first, as NDJSON or CSV"""
+    if format not in ("csv", "ndjson"):
+        raise HTTPException(status_code=400, detail="Formato deve ser csv ou ndjson")
     
-    # Get updated user data
-    updated_user = await db.users.find_one({"id": current_user.id})
+    async def export():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if format == "csv":
+            writer.writerow(MOOD_EXPORT_COLUMNS)
+        
+        rows = 0
+        async for mood in mood_entries_cursor(current_user.id, sort_direction=1):
+            record = {
+                "id": mood["id"],
+                "date": mood["date"].isoformat(),
+                "day_key": mood_entry_day(mood).isoformat(),
+                "mood_level": mood["mood_level"],
+                "mood_emoji": mood["mood_emoji"],
+                "description": mood.get("description")
+            }
+            if format == "csv":
+                writer.writerow([record[column] for column in MOOD_EXPORT_COLUMNS])
+            else:
+                buffer.write(json.dumps(record, ensure_ascii=False) + "\n")
+            
+            rows += 1
+            if rows % MOOD_EXPORT_FLUSH_ROWS == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
     
-    return User(
-        id=updated_user['id'],
-        name=updated_user['name'],
-        email=updated_user['email'],
-        profile_photo=updated_user.get('profile_photo'),
-        created_at=updated_user['created_at']
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        export(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="humor-diario.{format}"'}
     )
 
-# Mood Routes
-@api_router.post("/mood", response_model=MoodResponse)
-async def create_mood_entry(mood_data: MoodCreate, current_user: User = Depends(get_current_user)):
-    # Check if user already has a mood entry for today
-    today = datetime.utcnow().date()
-    existing_mood = await db.humor_diario.find_one({
-        "user_id": current_user.id,
-        "date": {
-            "$gte": datetime.combine(today, datetime.min.time()),
-            "$lt": datetime.combine(today + timedelta(days=1), datetime.min.time())
-        }
-    })
+async def import_mood_chunk(user_id: str, rows: List[tuple]) -> List[dict]:
+    """Upsert (row_number, MoodImportRow, day_key) rows in one unordered bulk write; returns per-row errors"""
+    last_version = await next_sync_version(user_id, len(rows))
+    sync_versions = {
+        row_number: last_version - len(rows) + 1 + offset
+        for offset, (row_number, _, _) in enumerate(rows)
+    }
     
-    if existing_mood:
-        # Update existing mood entry for today
-        mood_dict = {
-            "mood_level": mood_data.mood_level,
-            "mood_emoji": mood_data.mood_emoji,
-            "description": mood_data.description,
-            "date": datetime.utcnow()
-        }
-        
-        await db.humor_diario.update_one(
-            {"_id": existing_mood["_id"]},
-            {"$set": mood_dict}
-        )
-        
-        return MoodResponse(
-            id=existing_mood["id"],
-            mood_level=mood_data.mood_level,
-            mood_emoji=mood_data.mood_emoji,
-            description=mood_data.description,
-            date=mood_dict["date"]
-        )
-    else:
-        # Create new mood entry
-        mood_dict = {
-            "id": str(uuid.uuid4()),
-            "user_id": current_user.id,
-            "mood_level": mood_data.mood_level,
-            "mood_emoji": mood_data.mood_emoji,
-            "description": mood_data.description,
-            "date": datetime.utcnow()
-        }
-        
-        mood_entry = MoodEntry(**mood_dict)
-        await db.humor_diario.insert_one(mood_entry.dict())
-        
-        return MoodResponse(
-            id=mood_entry.id,
-            mood_level=mood_entry.mood_level,
-            mood_emoji=mood_entry.mood_emoji,
-            description=mood_entry.description,
-            date=mood_entry.date
-        )
-
-@api_router.get("/mood", response_model=List[MoodResponse])
-async def get_mood_history(current_user: User = Depends(get_current_user)):
-    mood_entries = await db.humor_diario.find(
-        {"user_id": current_user.id}
-    ).sort("date", -1).to_list(100)  # Last 100 entries, newest first
+    if MOOD_STORAGE_MODE != "buckets":
+        operations = [
+            UpdateOne(
+                {"user_id": user_id, "day_key": day_key},
+                {
+                    "$set": {
+                        "mood_level": row.mood_level,
+                        "mood_emoji": row.mood_emoji,
+                        "description": row.description,
+                        "date": row.date,
+                        "sync_version": sync_versions[row_number]
+                    },
+                    "$setOnInsert": {"id": str(uuid.uuid4())}
+                },
+                upsert=True
+            )
+            for row_number, row, day_key in rows
+        ]
+        try:
+            await db.humor_diario.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            return [
+                {"row": rows[error["index"]][0], "status": "error", "error": error.get("errmsg", "Erro de escrita")}
+                for error in e.details.get("writeErrors", [])
+            ]
+        return []
     
-    return [
-        MoodResponse(
-            id=mood["id"],
-            mood_level=mood["mood_level"],
-            mood_emoji=mood["mood_emoji"],
-            description=mood.get("description"),
-            date=mood["date"]
-        )
-        for mood in mood_entries
-    ]
+    # Buckets: one pipeline update per month replaces the imported days and appends them
+    by_month = {}
+    for row_number, row, day_key in rows:
+        by_month.setdefault(day_key[:7], []).append((row_number, row, int(day_key[8:])))
+    months = list(by_month)
+    operations = []
+    for month in months:
+        days = [day for _, _, day in by_month[month]]
+        entries = [
+            {
+                "day": day,
+                "id": str(uuid.uuid4()),
+                "level": row.mood_level,
+                "emoji_code": MOOD_EMOJIS.index(row.mood_emoji),
+                "description": row.description,
+                "date": row.date,
+                "sync_version": sync_versions[row_number]
+            }
+            for row_number, row, day in by_month[month]
+        ]
+        operations.append(UpdateOne(
+            {"user_id": user_id, "month": month},
+            [{"$set": {"entries": {"$concatArrays": [
+                {"$filter": {
+                    "input": {"$ifNull": ["$entries", []]},
+                    "cond": {"$not": [{"$in": ["$$this.day", days]}]}
+                }},
+                # $literal keeps user text such as "$x" from being read as a field path
+                {"$literal": entries}
+            ]}}}],
+            upsert=True
+        ))
+    try:
+        await db.humor_diario_buckets.bulk_write(operations, ordered=False)
+    except BulkWriteError as e:
+        return [
+            {"row": row_number, "status": "error", "error": error.get("errmsg", "Erro de escrita")}
+            for error in e.details.get("writeErrors", [])
+            for row_number, _, _ in by_month[months[error["index"]]]
+        ]
+    return []
 
-@api_router.get("/mood/today", response_model=Optional[MoodResponse])
-async def get_today_mood(current_user: User = Depends(get_current_user)):
-    today = datetime.utcnow().date()
-    mood_entry = await db.humor_diario.find_one({
-        "user_id": current_user.id,
-        "date": {
-            "$gte": datetime.combine(today, datetime.min.time()),
-            "$lt": datetime.combine(today + timedelta(days=1), datetime.min.time())
-        }
-    })
+@api_router.post("/mood/import")
+async def import_mood_history(
+    request: Request,
+    format: str = "csv",
+    current_user: TokenClaims = Depends(get_token_claims)
+):
+    """Import mood history from a CSV (header row) or NDJSON body.
+
+    Each row needs date and mood_level; mood_emoji and description are
+    optional. A row replaces whatever is stored for its local day. Streams
+    NDJSON back: one line per rejected row, a progress line per chunk and
+    a final summary.
+    """
+    if format not in ("csv", "ndjson"):
+        raise HTTPException(status_code=400, detail="Formato deve ser csv ou ndjson")
     
-    if mood_entry:
-        return MoodResponse(
-            id=mood_entry["id"],
-            mood_level=mood_entry["mood_level"],
-            mood_emoji=mood_entry["mood_emoji"],
-            description=mood_entry.get("description"),
-            date=mood_entry["date"]
-        )
+    body = await spool_request_body(request)
     
-    return None
-
-@api_router.get("/mood/week", response_model=List[MoodResponse])
-async def get_week_mood(current_user: User = Depends(get_current_user)):
-    # Get mood entries from the last 7 days
-    seven_days_ago = datetime.utcnow() - timedelta(days=7)
+    async def refresh_aggregates():
+        # Imported days can land anywhere in history; recompute rather than patch the rollups
+        await rebuild_user_mood_rollups(current_user.id)
+        invalidate_mood_caches(current_user.id)
     
-    mood_entries = await db.humor_diario.find({
-        "user_id": current_user.id,
-        "date": {"$gte": seven_days_ago}
-    }).sort("date", 1).to_list(7)  # Sort ascending (oldest first)
+    async def run_import():
+        summary = {"imported": 0, "invalid": 0, "failed": 0}
+        seen_days = set()
+        chunk = []
+        processed = 0
+        written = False
+        
+        async def write_chunk():
+            nonlocal written
+            written = True
+            errors = await import_mood_chunk(current_user.id, chunk)
+            summary["failed"] += len(errors)
+            summary["imported"] += len(chunk) - len(errors)
+            return errors
+        
+        try:
+            for row_number, raw, error in iter_upload_rows(body, format):
+                if error is None:
+                    try:
+                        row = MoodImportRow(**raw)
+                        day_key = local_day_key(row.date, current_user.timezone)
+                        if day_key in seen_days:
+                            error = "Dia duplicado no arquivo"
+                    except Exception as e:
+                        error = str(e)
+                
+                if error is not None:
+                    summary["invalid"] += 1
+                    yield json.dumps({"row": row_number, "status": "invalid", "error": error}, ensure_ascii=False) + "\n"
+                    continue
+                
+                seen_days.add(day_key)
+                chunk.append((row_number, row, day_key))
+                if len(chunk) >= MOOD_IMPORT_CHUNK_SIZE:
+                    for result in await write_chunk():
+                        yield json.dumps(result, ensure_ascii=False) + "\n"
+                    processed += len(chunk)
+                    chunk = []
+                    yield json.dumps({"type": "progress", "processed": processed}) + "\n"
+            
+            if chunk:
+                for result in await write_chunk():
+                    yield json.dumps(result, ensure_ascii=False) + "\n"
+                processed += len(chunk)
+        finally:
+            body.close()
+            if written:
+                # Also runs when the client disconnects mid-import; shielded so the
+                # rebuild finishes even if the response task is being cancelled
+                await asyncio.shield(refresh_aggregates())
+        
+        logger.info(f"Mood import for user {current_user.id}: {summary}")
+        yield json.dumps({"type": "summary", "processed": processed, **summary}) + "\n"
     
-    return [
-        MoodResponse(
-            id=mood["id"],
-            mood_level=mood["mood_level"],
-            mood_emoji=mood["mood_emoji"],
-            description=mood.get("description"),
-            date=mood["date"]
-        )
-        for mood in mood_entries
-    ]
+    return StreamingResponse(run_import(), media_type="application/x-ndjson")
 
 # Helper functions for gamification (Estrelas ⭐)
 def calculate_level_from_xp(xp: int) -> int:
@@ -568,27 +2323,25 @@ def get_level_info(level: int) -> dict:
 
 # Mission Routes
 @api_router.get("/missions/today")
-async def get_daily_missions(current_user: User = Depends(get_current_user)):
+async def get_daily_missions(current_user: TokenClaims = Depends(get_token_claims)):
     """Get today's dynamic missions for the user"""
     
     # Check subscription status first
     
-    # Initialize mission database if needed
-    await initialize_mission_database()
-    
     # Get user level for mission selection
     user_stats = await db.user_stats.find_one({"user_id": current_user.id})
     user_level = user_stats.get("current_level", 1) if user_stats else 1
     
     # Get today's missions (dynamic selection)
-    missions = await get_daily_missions_for_user(current_user.id, user_level)
+    today_key = local_day_key(datetime.utcnow(), current_user.timezone)
+    missions = await get_daily_missions_for_user(current_user.id, user_level, today_key)
     
     # Calculate total XP earned today
     total_xp_today = sum(mission.get("xp_reward", 0) for mission in missions if mission.get("completed", False))
     possible_xp = sum(mission.get("xp_reward", 0) for mission in missions)
     
     return {
-        "date": datetime.utcnow().date().isoformat(),
+        "date": today_key,
         "missions": missions,
         "total_xp_today": total_xp_today,
         "possible_xp": possible_xp,
@@ -596,21 +2349,29 @@ async def get_daily_missions(current_user: User = Depends(get_current_user)):
     }
 
 @api_router.post("/missions/complete")
-async def complete_mission(request: MissionCompleteRequest, current_user: User = Depends(get_current_user)):
+async def complete_mission(request: MissionCompleteRequest, current_user: TokenClaims = Depends(get_token_claims)):
     """Complete a daily mission and earn XP"""
-    today = datetime.utcnow().date()
-    today_start = datetime.combine(today, datetime.min.time())
+    now = datetime.utcnow()
+    today_key = local_day_key(now, current_user.timezone)
     
     # Check if mission exists and is valid for today
-    mission = await db.missions.find_one({"id": request.mission_id})
+    mission = mission_catalog.get(request.mission_id)
     if not mission:
         raise HTTPException(status_code=404, detail="Mission not found")
     
+    # Only missions of the set frozen for today earn XP
+    todays_set = await db.daily_mission_sets.find_one(
+        {"user_id": current_user.id, "day_key": today_key, "missions": request.mission_id},
+        {"_id": 1}
+    )
+    if not todays_set:
+        raise HTTPException(status_code=400, detail="Mission is not part of today's missions")
+    
     # Check if user already completed this mission today
     existing_progress = await db.user_mission_progress.find_one({
         "user_id": current_user.id,
         "mission_id": request.mission_id,
-        "date": {"$gte": today_start},
+        "day_key": today_key,
         "completed": True
     })
     
@@ -623,21 +2384,28 @@ async def complete_mission(request: MissionCompleteRequest, current_user: User =
         id=progress_id,
         user_id=current_user.id,
         mission_id=request.mission_id,
-        date=datetime.utcnow(),
+        date=now,
+        day_key=today_key,
         completed=True,
-        completed_at=datetime.utcnow(),
+        completed_at=now,
         xp_earned=mission["xp_reward"]
     )
+    progress_document = {**progress_data.dict(), "sync_version": await next_sync_version(current_user.id)}
     
-    # Remove any existing incomplete progress for this mission today
+    # Remove any existing incomplete progress for this mission today; a completed one stays,
+    # so a concurrent completion hits the unique index below instead of replacing it
     await db.user_mission_progress.delete_many({
         "user_id": current_user.id,
         "mission_id": request.mission_id,
-        "date": {"$gte": today_start}
+        "day_key": today_key,
+        "completed": {"$ne": True}
     })
     
-    # Insert new completed progress
-    await db.user_mission_progress.insert_one(progress_data.dict())
+    # Insert new completed progress; the unique (user_id, day_key, mission_id) index stops double completion
+    try:
+        await db.user_mission_progress.insert_one(progress_document)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Mission already completed today")
     
     # Update user XP
     await update_user_stats(current_user.id, mission["xp_reward"])
@@ -645,7 +2413,7 @@ async def complete_mission(request: MissionCompleteRequest, current_user: User =
     # Calculate total XP earned today
     today_progress = await db.user_mission_progress.find({
         "user_id": current_user.id,
-        "date": {"$gte": today_start},
+        "day_key": today_key,
         "completed": True
     }).to_list(100)
     
@@ -660,7 +2428,7 @@ async def complete_mission(request: MissionCompleteRequest, current_user: User =
     }
 
 @api_router.get("/user/stats", response_model=UserStatsResponse)
-async def get_user_stats(current_user: User = Depends(get_current_user)):
+async def get_user_stats(current_user: TokenClaims = Depends(get_token_claims)):
     # Find or create user stats
     user_stats = await db.user_stats.find_one({"user_id": current_user.id})
     
@@ -676,7 +2444,10 @@ async def get_user_stats(current_user: User = Depends(get_current_user)):
         }
         
         user_stats_obj = UserStats(**stats_dict)
-        await db.user_stats.insert_one(user_stats_obj.dict())
+        await db.user_stats.insert_one({
+            **user_stats_obj.dict(),
+            "sync_version": await next_sync_version(current_user.id)
+        })
         user_stats = user_stats_obj.dict()
     
     current_level = calculate_level_from_xp(user_stats["total_xp"])
@@ -714,7 +2485,10 @@ async def update_user_stats(user_id: str, xp_to_add: int):
         }
         
         user_stats_obj = UserStats(**stats_dict)
-        await db.user_stats.insert_one(user_stats_obj.dict())
+        await db.user_stats.insert_one({
+            **user_stats_obj.dict(),
+            "sync_version": await next_sync_version(user_id)
+        })
     else:
         # Update existing stats
         new_xp = user_stats["total_xp"] + xp_to_add
@@ -725,7 +2499,8 @@ async def update_user_stats(user_id: str, xp_to_add: int):
             {"$set": {
                 "total_xp": new_xp,
                 "current_level": new_level,
-                "updated_at": datetime.utcnow()
+                "updated_at": datetime.utcnow(),
+                "sync_version": await next_sync_version(user_id)
             }}
         )
 
@@ -734,6 +2509,23 @@ async def update_user_stats(user_id: str, xp_to_add: int):
 async def root():
     return {"message": "Mental Health App API"}
 
+async def require_admin(request: Request):
+    """Admin endpoints require the X-Admin-Key header to match ADMIN_API_KEY"""
+    provided = request.headers.get("X-Admin-Key", "")
+    if not ADMIN_API_KEY or not secrets.compare_digest(provided, ADMIN_API_KEY):
+        raise HTTPException(status_code=403, detail="Acesso negado")
+
+@api_router.get("/metrics", dependencies=[Depends(require_admin)])
+async def get_metrics():
+    """Process-local performance counters"""
+    return {
+        "user_cache": user_cache.stats(),
+        "mood_cache": mood_cache.stats(),
+        "password_hash_pool": password_hash_pool.stats(),
+        "token_revocation_list": token_revocation_list.stats(),
+        "auth_rate_limiter": auth_rate_limiter.stats()
+    }
+
 @api_router.post("/status", response_model=StatusCheck)
 async def create_status_check(input: StatusCheckCreate, current_user: User = Depends(get_current_user)):
     status_dict = input.dict()
@@ -1027,10 +2819,6 @@ async def initialize_default_plans():
 async def create_free_trial(user_id: str):
     """Create a 7-day free trial for new user"""
     try:
-        existing = await db.user_subscriptions.find_one({"user_id": user_id})
-        if existing:
-            return  # User already has a subscription
-        
         now = datetime.utcnow()
         trial_end = now + timedelta(days=7)
         
@@ -1046,8 +2834,14 @@ async def create_free_trial(user_id: str):
             "updated_at": now
         }
         
-        await db.user_subscriptions.insert_one(subscription)
-        logger.info(f"Created free trial for user: {user_id}")
+        # Upsert keeps an existing subscription untouched in a single round trip
+        result = await db.user_subscriptions.update_one(
+            {"user_id": user_id},
+            {"$setOnInsert": subscription},
+            upsert=True
+        )
+        if result.upserted_id is not None:
+            logger.info(f"Created free trial for user: {user_id}")
         
     except Exception as e:
         logger.error(f"Error creating free trial: {e}")
@@ -1312,10 +3106,88 @@ Diretrizes importantes:
     return base_message
 
 # Dynamic Mission System
-async def initialize_mission_database():
-    """Initialize the mission database with all available missions"""
-    
-    missions = [
+class MissionCatalog:
+    """Immutable, process-local snapshot of the missions collection.
+
+    Missions are read-only mappings indexed by id, by category and by
+    min_level. A new snapshot replaces the old one when the stored catalog
+    version changes; a snapshot itself is never modified.
+    """
+
+    def __init__(self, missions: List[dict], version: str):
+        ordered = sorted(missions, key=lambda mission: (mission["min_level"], mission["id"]))
+        self.version = version
+        self._missions = tuple(
+            MappingProxyType({**mission, "tips": tuple(mission.get("tips") or ())}) for mission in ordered
+        )
+        self._levels = tuple(mission["min_level"] for mission in self._missions)
+        self._by_id = MappingProxyType({mission["id"]: mission for mission in self._missions})
+        
+        by_category = {}
+        for mission in self._missions:
+            by_category.setdefault(mission["category"], []).append(mission)
+        # Per category: (sorted min_levels, missions in the same order) for bisecting by level
+        self._by_category = MappingProxyType({
+            category: (tuple(mission["min_level"] for mission in group), tuple(group))
+            for category, group in by_category.items()
+        })
+
+    def __len__(self) -> int:
+        return len(self._missions)
+
+    def get(self, mission_id: str):
+        return self._by_id.get(mission_id)
+
+    @property
+    def categories(self) -> tuple:
+        return tuple(self._by_category)
+
+    def eligible(self, user_level: int) -> tuple:
+        """Missions unlocked at `user_level`"""
+        return self._missions[:bisect_right(self._levels, user_level)]
+
+    def documents(self) -> List[dict]:
+        """Plain (picklable) copies of the missions, e.g. to hand to worker processes"""
+        return [{**mission, "tips": list(mission["tips"])} for mission in self._missions]
+
+    def eligible_by_category(self, user_level: int) -> dict:
+        """Unlocked missions grouped by category; categories with none unlocked are left out"""
+        grouped = {}
+        for category, (levels, missions) in self._by_category.items():
+            unlocked = missions[:bisect_right(levels, user_level)]
+            if unlocked:
+                grouped[category] = unlocked
+        return grouped
+
+def mission_catalog_version(missions: List[dict]) -> str:
+    """Content hash of a set of missions, independent of their order"""
+    canonical = json.dumps(sorted(missions, key=lambda mission: mission["id"]), sort_keys=True, default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:16]
+
+mission_catalog = MissionCatalog([], "")
+
+async def load_mission_catalog() -> MissionCatalog:
+    """Replace the process-local catalog with a fresh snapshot of the missions collection"""
+    global mission_catalog
+    missions = await db.missions.find({}, {"_id": 0}).to_list(None)
+    mission_catalog = MissionCatalog(missions, mission_catalog_version(missions))
+    logger.info(f"Loaded mission catalog {mission_catalog.version} with {len(mission_catalog)} missions")
+    return mission_catalog
+
+async def refresh_mission_catalog_periodically():
+    """Background task reloading the catalog when another process publishes a new version"""
+    while True:
+        await asyncio.sleep(MISSION_CATALOG_REFRESH_SECONDS)
+        try:
+            stored = await db.catalog_versions.find_one({"_id": "missions"})
+            if stored and stored["version"] != mission_catalog.version:
+                await load_mission_catalog()
+        except Exception as e:
+            logger.error(f"Error refreshing mission catalog: {e}")
+
+def mission_seed() -> List[Mission]:
+    """The mission catalog as shipped with this release; the missions collection is synced to it"""
+    return [
         # MINDFULNESS & MEDITAÇÃO
         Mission(
             id="mindfulness_meditation_5min",
@@ -1717,106 +3589,231 @@ async def initialize_mission_database():
         )
     ]
 
-    # Check if missions are already in database
-    existing_count = await db.missions.count_documents({})
+def mission_document(mission: Mission) -> dict:
+    return {**mission.dict(), "category": mission.category.value, "difficulty": mission.difficulty.value}
+
+async def sync_mission_catalog(force: bool = False) -> dict:
+    """Bring the missions collection in line with mission_seed() and publish its version.
+
+    Compares the seed's content hash with the stored version and, when they
+    differ (or with force), writes only new, edited and removed missions in
+    one bulk_write.
+    """
+    desired = {mission.id: mission_document(mission) for mission in mission_seed()}
+    version = mission_catalog_version(list(desired.values()))
     
-    if existing_count == 0:
-        logger.info("Initializing mission database with all missions...")
-        for mission in missions:
-            await db.missions.insert_one(mission.dict())
-        logger.info(f"Added {len(missions)} missions to database")
-    else:
-        logger.info(f"Mission database already initialized with {existing_count} missions")
+    stored = await db.catalog_versions.find_one({"_id": "missions"})
+    if stored and stored["version"] == version and not force:
+        return {"version": version, "status": "unchanged", "upserted": 0, "removed": 0}
+    
+    current = {}
+    duplicates = []
+    async for mission in db.missions.find({}):
+        if mission["id"] in current:
+            # Left behind by concurrent first-time seeding; keep one copy
+            duplicates.append(mission["_id"])
+            continue
+        current[mission["id"]] = {key: value for key, value in mission.items() if key != "_id"}
+    if duplicates:
+        await db.missions.delete_many({"_id": {"$in": duplicates}})
+    await db.missions.create_index("id", unique=True)
+    
+    changed = [document for mission_id, document in desired.items() if current.get(mission_id) != document]
+    removed = [mission_id for mission_id in current if mission_id not in desired]
+    operations = [ReplaceOne({"id": document["id"]}, document, upsert=True) for document in changed]
+    if removed:
+        operations.append(DeleteMany({"id": {"$in": removed}}))
+    if operations:
+        await db.missions.bulk_write(operations, ordered=False)
+    
+    # Publishing the version makes every worker reload its catalog
+    await db.catalog_versions.update_one(
+        {"_id": "missions"},
+        {"$set": {"version": version, "updated_at": datetime.utcnow()}},
+        upsert=True
+    )
+    logger.info(f"Mission catalog {version}: {len(changed)} missions upserted, {len(removed)} removed")
+    return {"version": version, "status": "updated", "upserted": len(changed), "removed": len(removed)}
 
-async def get_daily_missions_for_user(user_id: str, user_level: int = 1) -> List[dict]:
-    """Generate or retrieve daily missions for a user"""
-    today = datetime.utcnow().date()
-    today_start = datetime.combine(today, datetime.min.time())
+def mission_selection_rng(user_id: str, day_key: str, catalog_version: str) -> random.Random:
+    """Random generator seeded by (user_id, day_key, catalog_version), identical on every worker"""
+    seed = hashlib.sha256(f"{user_id}:{day_key}:{catalog_version}".encode('utf-8')).digest()
+    return random.Random(int.from_bytes(seed[:8], "big"))
+
+def select_daily_missions(catalog: MissionCatalog, user_level: int, rng=random) -> list:
+    """Pick three unlocked missions, from different categories when possible"""
+    available_missions = catalog.eligible(user_level)
+    by_category = catalog.eligible_by_category(user_level)
     
-    # Check if user already has missions for today
-    existing_set = await db.daily_mission_sets.find_one({
-        "user_id": user_id,
-        "date": {"$gte": today_start}
-    })
+    # Try to get one from each category first
+    available_categories = list(by_category)
+    rng.shuffle(available_categories)
+    selected_missions = [rng.choice(by_category[category]) for category in available_categories[:3]]
     
-    if existing_set:
-        # Get missions for existing set
-        mission_ids = existing_set["missions"]
-        missions = []
-        for mission_id in mission_ids:
-            mission = await db.missions.find_one({"id": mission_id})
-            if mission:
-                missions.append(mission)
-    else:
-        # Generate new missions for today
-        import random
-        
-        # Get all available missions for user level
-        available_missions = await db.missions.find({
-            "min_level": {"$lte": user_level}
-        }).to_list(100)
-        
-        # Group by category to ensure variety
-        by_category = {}
-        for mission in available_missions:
-            category = mission["category"]
-            if category not in by_category:
-                by_category[category] = []
-            by_category[category].append(mission)
-        
-        # Select 3 missions from different categories when possible
-        selected_missions = []
-        categories_used = []
-        
-        # Try to get one from each category first
-        available_categories = list(by_category.keys())
-        random.shuffle(available_categories)
-        
-        for category in available_categories:
-            if len(selected_missions) < 3:
-                mission = random.choice(by_category[category])
-                selected_missions.append(mission)
-                categories_used.append(category)
-        
-        # If we need more missions, fill from unused categories or randomly
-        while len(selected_missions) < 3:
-            remaining_missions = [m for m in available_missions if m not in selected_missions]
-            if remaining_missions:
-                selected_missions.append(random.choice(remaining_missions))
-        
-        # Save daily mission set
-        mission_set = DailyMissionSet(
+    # If we need more missions, fill from the remaining ones
+    while len(selected_missions) < 3:
+        remaining_missions = [m for m in available_missions if m not in selected_missions]
+        if not remaining_missions:
+            break
+        selected_missions.append(rng.choice(remaining_missions))
+    
+    return selected_missions
+
+def generate_mission_sets(missions: List[dict], catalog_version: str, assignments: List[tuple]) -> List[dict]:
+    """daily_mission_sets documents for (user_id, user_level, day_key) assignments; runs in worker processes"""
+    catalog = MissionCatalog(missions, catalog_version)
+    now = datetime.utcnow()
+    return [
+        DailyMissionSet(
             id=str(uuid.uuid4()),
-            date=datetime.utcnow(),
-            missions=[m["id"] for m in selected_missions],
-            user_id=user_id
+            date=now,
+            day_key=day_key,
+            missions=[
+                mission["id"]
+                for mission in select_daily_missions(
+                    catalog, user_level, mission_selection_rng(user_id, day_key, catalog_version)
+                )
+            ],
+            user_id=user_id,
+            user_level=user_level,
+            catalog_version=catalog_version
+        ).dict()
+        for user_id, user_level, day_key in assignments
+    ]
+
+async def freeze_daily_mission_set(user_id: str, user_level: int, day_key: str, catalog: MissionCatalog) -> dict:
+    """Store the deterministic pick as the user's set for a day that has none yet.
+
+    Returns the stored set, which is another worker's pick if it got there first.
+    """
+    rng = mission_selection_rng(user_id, day_key, catalog.version)
+    mission_set = DailyMissionSet(
+        id=str(uuid.uuid4()),
+        date=datetime.utcnow(),
+        day_key=day_key,
+        missions=[mission["id"] for mission in select_daily_missions(catalog, user_level, rng)],
+        user_id=user_id,
+        user_level=user_level,
+        catalog_version=catalog.version
+    ).dict()
+    query = {"user_id": user_id, "day_key": day_key}
+    for field in query:
+        del mission_set[field]
+    
+    try:
+        return await db.daily_mission_sets.find_one_and_update(
+            query,
+            {"$setOnInsert": mission_set},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+            projection={"missions": 1}
         )
-        
-        await db.daily_mission_sets.insert_one(mission_set.dict())
-        missions = selected_missions
+    except DuplicateKeyError:
+        # A concurrent first view stored the day's set first; use that one
+        return await db.daily_mission_sets.find_one(query, {"missions": 1})
+
+async def get_daily_missions_for_user(user_id: str, user_level: int = 1, day_key: Optional[str] = None) -> List[dict]:
+    """Daily missions for a user's local day.
+    
+    The set is picked deterministically from (user_id, day_key, catalog
+    version), so every worker agrees on it, and stored on the day's first
+    view: levelling up or a catalog reload later that day does not reshuffle
+    it. Later views are a single indexed read, alongside the progress query.
+    A set stored beforehand (pinned by the nightly job) wins.
+    """
+    day_key = day_key or local_day_key(datetime.utcnow())
+    catalog = mission_catalog
+    
+    # The day's set and today's progress in one round trip
+    mission_set, progress_docs = await asyncio.gather(
+        db.daily_mission_sets.find_one({"user_id": user_id, "day_key": day_key}, {"missions": 1}),
+        db.user_mission_progress.find(
+            {"user_id": user_id, "day_key": day_key},
+            {"mission_id": 1, "completed": 1}
+        ).to_list(None)
+    )
+    if not mission_set:
+        # First view of the day: the only time the selection runs and the set is written
+        mission_set = await freeze_daily_mission_set(user_id, user_level, day_key, catalog)
+    
+    # Ids dropped from the catalog since the set was stored are skipped
+    missions = [
+        dict(catalog.get(mission_id))
+        for mission_id in mission_set["missions"]
+        if catalog.get(mission_id)
+    ]
     
-    # Get user progress for today's missions and clean ObjectIds
+    progress_by_mission = {progress["mission_id"]: progress for progress in progress_docs}
     for mission in missions:
-        # Convert ObjectId to string
-        if "_id" in mission:
-            mission["_id"] = str(mission["_id"])
-            
-        progress = await db.user_mission_progress.find_one({
-            "user_id": user_id,
-            "mission_id": mission["id"],
-            "date": {"$gte": today_start}
-        })
-        
+        progress = progress_by_mission.get(mission["id"])
         mission["completed"] = progress["completed"] if progress else False
         mission["progress_id"] = str(progress["_id"]) if progress else None
     
     return missions
 
+async def ensure_index(collection: str, keys, required: bool = False, **options):
+    """Create an index; a required one aborts startup when it cannot be built"""
+    try:
+        await db[collection].create_index(keys, **options)
+    except Exception as e:
+        if required:
+            raise RuntimeError(f"Could not create required index on {collection} {keys} (duplicate data?): {e}") from e
+        logger.error(f"Could not create index on {collection} {keys} (duplicate data?): {e}")
+
 @app.on_event("startup")
 async def startup_event():
     """Initialize app on startup"""
     await initialize_default_plans()
-    await initialize_mission_database()
+    await sync_mission_catalog()
+    await load_mission_catalog()
+    asyncio.create_task(refresh_mission_catalog_periodically())
+    await password_hash_pool.calibrate()
+    
+    # Each index on its own, so one failure does not skip the rest. Unique indexes that
+    # registration, upserts and per-day dedup rely on are required: startup fails rather
+    # than run without them (registration only detects a taken email by DuplicateKeyError).
+    await ensure_index("users", "email", required=True, unique=True)
+    await ensure_index("user_subscriptions", "user_id", required=True, unique=True)
+    await ensure_index("auth_lockouts", "key", required=True, unique=True)
+    await ensure_index("auth_lockouts", "locked_until", expireAfterSeconds=0)
+    await ensure_index("humor_diario", [("user_id", 1), ("date", -1), ("id", -1)])
+    await ensure_index("humor_diario_buckets", [("user_id", 1), ("month", 1)], required=True, unique=True)
+    # Sync pulls in bucket mode only touch buckets holding a change
+    await ensure_index("humor_diario_buckets", [("user_id", 1), ("entries.sync_version", 1)])
+    await ensure_index("mood_rollups", [("user_id", 1), ("period", 1), ("key", 1)], required=True, unique=True)
+    await ensure_index("sync_versions", "user_id", required=True, unique=True)
+    await ensure_index("insights", "user_id", required=True, unique=True)
+    for collection in ("humor_diario", "sync_tombstones", *SYNC_SOURCES.values()):
+        await ensure_index(collection, [("user_id", 1), ("sync_version", 1)])
+    # Partial: legacy entries without a day_key are ignored until backfilled
+    await ensure_index(
+        "humor_diario", [("user_id", 1), ("day_key", 1)], required=True,
+        unique=True, partialFilterExpression={"day_key": {"$exists": True}}
+    )
+    await ensure_index(
+        "gratitude_entries", [("user_id", 1), ("day_key", 1)], required=True,
+        unique=True, partialFilterExpression={"day_key": {"$exists": True}}
+    )
+    await ensure_index(
+        "daily_mission_sets", [("user_id", 1), ("day_key", 1)], required=True,
+        unique=True, partialFilterExpression={"day_key": {"$type": "string"}}
+    )
+    await ensure_index(
+        "user_mission_progress", [("user_id", 1), ("day_key", 1), ("mission_id", 1)], required=True,
+        unique=True, partialFilterExpression={"day_key": {"$type": "string"}}
+    )
+    # Lets the nightly pinning of mission sets find recently active users
+    await ensure_index("user_mission_progress", "day_key")
+    
+    # Revoked tokens expire together with the access token they revoke
+    await ensure_index("revoked_tokens", "jti", required=True, unique=True)
+    await ensure_index("revoked_tokens", "expires_at", expireAfterSeconds=0)
+    await token_revocation_list.refresh()
+    asyncio.create_task(refresh_revocation_list_periodically())
+    
+    await ensure_index("refresh_tokens", "token_hash", required=True, unique=True)
+    await ensure_index("refresh_tokens", "family_id")
+    await ensure_index("refresh_tokens", "expires_at", expireAfterSeconds=0)
 
 app.add_middleware(
     CORSMiddleware,
@@ -1824,6 +3821,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
     allow_headers=["*", "Authorization", "Content-Type"],
+    expose_headers=["X-Next-Cursor", "X-Prev-Cursor"],
 )
 
 # ============================================
@@ -1918,36 +3916,34 @@ class ReminderUpdate(BaseModel):
 @api_router.post("/gratitude", response_model=GratitudeEntryResponse)
 async def create_gratitude_entry(
     entry: GratitudeEntryCreate,
-    current_user: User = Depends(get_current_user)
+    current_user: TokenClaims = Depends(get_token_claims)
 ):
     """Create a new gratitude journal entry"""
     try:
-        today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-        
-        # Check if entry already exists for today
-        existing = await db.gratitude_entries.find_one({
-            "user_id": current_user.id,
-            "date": {"$gte": today, "$lt": today + timedelta(days=1)}
-        })
-        
-        if existing:
-            raise HTTPException(status_code=400, detail="Você já registrou gratidão hoje. Edite a entrada existente.")
+        now = datetime.utcnow()
+        today_key = local_day_key(now, current_user.timezone)
         
         entry_dict = {
             "id": str(uuid.uuid4()),
             "user_id": current_user.id,
             "gratitudes": entry.gratitudes[:3],  # Max 3
             "reflection": entry.reflection,
-            "date": today,
-            "created_at": datetime.utcnow()
+            "date": datetime.strptime(today_key, "%Y-%m-%d"),
+            "day_key": today_key,
+            "created_at": now,
+            "sync_version": await next_sync_version(current_user.id)
         }
         
-        await db.gratitude_entries.insert_one(entry_dict)
+        # One entry per local day, enforced by the unique (user_id, day_key) index
+        try:
+            await db.gratitude_entries.insert_one(entry_dict)
+        except DuplicateKeyError:
+            raise HTTPException(status_code=400, detail="Você já registrou gratidão hoje. Edite a entrada existente.")
         
         # Award 10 stars for gratitude practice
         await db.user_stats.update_one(
             {"user_id": current_user.id},
-            {"$inc": {"total_xp": 10}}
+            {"$inc": {"total_xp": 10}, "$set": {"sync_version": await next_sync_version(current_user.id)}}
         )
         
         return GratitudeEntryResponse(
@@ -1965,14 +3961,12 @@ async def create_gratitude_entry(
         raise HTTPException(status_code=500, detail="Erro ao criar entrada de gratidão")
 
 @api_router.get("/gratitude/today")
-async def get_today_gratitude(current_user: User = Depends(get_current_user)):
+async def get_today_gratitude(current_user: TokenClaims = Depends(get_token_claims)):
     """Get today's gratitude entry"""
     try:
-        today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-        
         entry = await db.gratitude_entries.find_one({
             "user_id": current_user.id,
-            "date": {"$gte": today, "$lt": today + timedelta(days=1)}
+            "day_key": local_day_key(datetime.utcnow(), current_user.timezone)
         })
         
         if not entry:
@@ -1993,7 +3987,7 @@ async def get_today_gratitude(current_user: User = Depends(get_current_user)):
 @api_router.get("/gratitude/history")
 async def get_gratitude_history(
     limit: int = 30,
-    current_user: User = Depends(get_current_user)
+    current_user: TokenClaims = Depends(get_token_claims)
 ):
     """Get gratitude history"""
     try:
@@ -2023,7 +4017,7 @@ async def get_gratitude_history(
 @api_router.post("/breathing/session", response_model=BreathingSessionResponse)
 async def create_breathing_session(
     session: BreathingSessionCreate,
-    current_user: User = Depends(get_current_user)
+    current_user: TokenClaims = Depends(get_token_claims)
 ):
     """Record a breathing exercise session"""
     try:
@@ -2034,7 +4028,8 @@ async def create_breathing_session(
             "duration_seconds": session.duration_seconds,
             "completed": session.completed,
             "date": datetime.utcnow(),
-            "created_at": datetime.utcnow()
+            "created_at": datetime.utcnow(),
+            "sync_version": await next_sync_version(current_user.id)
         }
         
         await db.breathing_sessions.insert_one(session_dict)
@@ -2044,7 +4039,7 @@ async def create_breathing_session(
         if stars_earned > 0:
             await db.user_stats.update_one(
                 {"user_id": current_user.id},
-                {"$inc": {"total_xp": stars_earned}}
+                {"$inc": {"total_xp": stars_earned}, "$set": {"sync_version": await next_sync_version(current_user.id)}}
             )
         
         return BreathingSessionResponse(
@@ -2061,7 +4056,7 @@ async def create_breathing_session(
         raise HTTPException(status_code=500, detail="Erro ao registrar sessão")
 
 @api_router.get("/breathing/stats")
-async def get_breathing_stats(current_user: User = Depends(get_current_user)):
+async def get_breathing_stats(current_user: TokenClaims = Depends(get_token_claims)):
     """Get breathing exercise statistics"""
     try:
         # Count total sessions
@@ -2105,7 +4100,7 @@ async def get_breathing_stats(current_user: User = Depends(get_current_user)):
 # ============================================
 
 @api_router.get("/reminders")
-async def get_reminders(current_user: User = Depends(get_current_user)):
+async def get_reminders(current_user: TokenClaims = Depends(get_token_claims)):
     """Get all user reminders"""
     try:
         reminders = await db.user_reminders.find(
@@ -2125,7 +4120,7 @@ async def get_reminders(current_user: User = Depends(get_current_user)):
 @api_router.post("/reminders")
 async def create_reminder(
     reminder: ReminderCreate,
-    current_user: User = Depends(get_current_user)
+    current_user: TokenClaims = Depends(get_token_claims)
 ):
     """Create a new reminder"""
     try:
@@ -2142,7 +4137,8 @@ async def create_reminder(
             "enabled": reminder.enabled,
             "days": reminder.days,
             "created_at": now,
-            "updated_at": now
+            "updated_at": now,
+            "sync_version": await next_sync_version(current_user.id)
         }
         
         await db.user_reminders.insert_one(db_document)
@@ -2168,22 +4164,24 @@ async def create_reminder(
 async def update_reminder(
     reminder_id: str,
     reminder: ReminderUpdate,
-    current_user: User = Depends(get_current_user)
+    current_user: TokenClaims = Depends(get_token_claims)
 ):
     """Update a reminder"""
     try:
         update_data = {k: v for k, v in reminder.dict().items() if v is not None}
         update_data["updated_at"] = datetime.utcnow()
+        update_data["sync_version"] = await next_sync_version(current_user.id)
         
-        result = await db.user_reminders.update_one(
+        updated = await db.user_reminders.find_one_and_update(
             {"id": reminder_id, "user_id": current_user.id},
-            {"$set": update_data}
+            {"$set": update_data},
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER
         )
         
-        if result.matched_count == 0:
+        if updated is None:
             raise HTTPException(status_code=404, detail="Lembrete não encontrado")
         
-        updated = await db.user_reminders.find_one({"id": reminder_id})
         return updated
         
     except HTTPException:
@@ -2195,7 +4193,7 @@ async def update_reminder(
 @api_router.delete("/reminders/{reminder_id}")
 async def delete_reminder(
     reminder_id: str,
-    current_user: User = Depends(get_current_user)
+    current_user: TokenClaims = Depends(get_token_claims)
 ):
     """Delete a reminder"""
     try:
@@ -2207,6 +4205,15 @@ async def delete_reminder(
         if result.deleted_count == 0:
             raise HTTPException(status_code=404, detail="Lembrete não encontrado")
         
+        # Leave a tombstone so synced clients drop their copy
+        await db.sync_tombstones.insert_one({
+            "user_id": current_user.id,
+            "type": "reminders",
+            "id": reminder_id,
+            "sync_version": await next_sync_version(current_user.id),
+            "deleted_at": datetime.utcnow()
+        })
+        
         return {"message": "Lembrete deletado com sucesso"}
         
     except HTTPException:
@@ -2215,6 +4222,137 @@ async def delete_reminder(
         logger.error(f"Error deleting reminder: {e}")
         raise HTTPException(status_code=500, detail="Erro ao deletar lembrete")
 
+# ============================================
+# DELTA SYNC ENDPOINTS
+# ============================================
+
+class SyncWrite(BaseModel):
+    client_id: str  # Echoed back so the client can clear its queue
+    type: str  # One of SYNC_WRITE_HANDLERS
+    data: dict = {}
+    recorded_at: Optional[datetime] = None  # Mood only: when the entry was made offline
+
+class SyncRequest(BaseModel):
+    since: int = 0
+    writes: List[SyncWrite] = []
+    
+    @validator('writes')
+    def limit_writes(cls, v):
+        if len(v) > SYNC_MAX_WRITES:
+            raise ValueError(f'Máximo de {SYNC_MAX_WRITES} escritas por sincronização')
+        return v
+
+# Synced collections other than mood (which depends on the storage mode)
+SYNC_SOURCES = {
+    "gratitude": "gratitude_entries",
+    "breathing": "breathing_sessions",
+    "reminders": "user_reminders",
+    "mission_progress": "user_mission_progress"
+}
+
+async def record_offline_mood(write: SyncWrite, current_user: TokenClaims):
+    now = datetime.utcnow()
+    moment = now
+    if write.recorded_at is not None:
+        recorded_at = write.recorded_at
+        if recorded_at.tzinfo is not None:
+            recorded_at = recorded_at.astimezone(UTC_ZONE).replace(tzinfo=None)
+        # Never let a client clock put an entry in the future
+        moment = min(recorded_at, now)
+    return await record_mood_entry(current_user, MoodCreate(**write.data), moment)
+
+SYNC_WRITE_HANDLERS = {
+    "mood": record_offline_mood,
+    "gratitude": lambda write, user: create_gratitude_entry(GratitudeEntryCreate(**write.data), user),
+    "breathing": lambda write, user: create_breathing_session(BreathingSessionCreate(**write.data), user),
+    "reminder.create": lambda write, user: create_reminder(ReminderCreate(**write.data), user),
+    "reminder.update": lambda write, user: update_reminder(write.data.get("id", ""), ReminderUpdate(**write.data), user),
+    "reminder.delete": lambda write, user: delete_reminder(write.data.get("id", ""), user),
+    "mission.complete": lambda write, user: complete_mission(MissionCompleteRequest(**write.data), user)
+}
+
+async def collect_sync_changes(user_id: str, since: int) -> dict:
+    """Everything the user changed after sync version `since`, oldest change first.
+
+    Each collection returns at most SYNC_PAGE_SIZE documents. When one is
+    cut short, `version` stops at the last change every collection has
+    fully delivered and `has_more` is set. `version` also stays before any
+    version reserved in the last SYNC_WRITE_GRACE_SECONDS, so a write still
+    in flight is not skipped. Documents past `version` may come again on the
+    next call, so clients apply changes as idempotent upserts.
+    """
+    # Read before the collections: a reservation made after this point is above `version`
+    version = settled_sync_version(await db.sync_versions.find_one({"user_id": user_id}))
+    changed = {"sync_version": {"$gt": since}}
+    page_limit = SYNC_PAGE_SIZE + 1
+    boundaries = []
+    
+    def page(documents: List[dict]) -> List[dict]:
+        if len(documents) > SYNC_PAGE_SIZE:
+            documents = documents[:SYNC_PAGE_SIZE]
+            boundaries.append(documents[-1]["sync_version"])
+        return documents
+    
+    changes = {
+        "mood": page(await find_mood_entries(user_id, changed, 1, page_limit, sort_field="sync_version"))
+    }
+    for name, collection in SYNC_SOURCES.items():
+        changes[name] = page(
+            await db[collection].find({"user_id": user_id, **changed}, {"_id": 0})
+            .sort("sync_version", 1).limit(page_limit).to_list(page_limit)
+        )
+    
+    tombstones = page(
+        await db.sync_tombstones.find({"user_id": user_id, **changed}, {"_id": 0})
+        .sort("sync_version", 1).limit(page_limit).to_list(page_limit)
+    )
+    deleted = {}
+    for tombstone in tombstones:
+        deleted.setdefault(tombstone["type"], []).append(tombstone["id"])
+    
+    stats = await db.user_stats.find_one({"user_id": user_id, **changed}, {"_id": 0, "total_xp": 1})
+    if stats:
+        # Star awards only $inc total_xp, so derive the level rather than trusting the stored one
+        stats["current_level"] = calculate_level_from_xp(stats["total_xp"])
+    
+    return {
+        "version": max(min([version, *boundaries]), since),
+        "has_more": bool(boundaries),
+        "changes": changes,
+        "deleted": deleted,
+        "stats": stats
+    }
+
+@api_router.get("/sync")
+async def sync_pull(since: int = 0, current_user: TokenClaims = Depends(get_token_claims)):
+    """Changes to mood, gratitude, breathing, reminders, mission progress and stats since `since`.
+
+    Pass the returned `version` as `since` next time; repeat while `has_more`.
+    """
+    return await collect_sync_changes(current_user.id, max(since, 0))
+
+@api_router.post("/sync")
+async def sync_push(sync_request: SyncRequest, current_user: TokenClaims = Depends(get_token_claims)):
+    """Apply queued client writes in order, then return the changes since `since` (including theirs)"""
+    results = []
+    for write in sync_request.writes:
+        handler = SYNC_WRITE_HANDLERS.get(write.type)
+        if handler is None:
+            results.append({"client_id": write.client_id, "status": "error", "status_code": 400, "detail": "Tipo de escrita desconhecido"})
+            continue
+        try:
+            result = await handler(write, current_user)
+        except HTTPException as e:
+            results.append({"client_id": write.client_id, "status": "error", "status_code": e.status_code, "detail": e.detail})
+        except Exception as e:
+            # Payload did not validate against the endpoint's model
+            results.append({"client_id": write.client_id, "status": "error", "status_code": 422, "detail": str(e)})
+        else:
+            results.append({"client_id": write.client_id, "status": "ok", "result": result})
+    
+    changes = await collect_sync_changes(current_user.id, max(sync_request.since, 0))
+    return {**changes, "results": results}
+
 # ============================================
 # STRIPE PAYMENT ENDPOINTS
 # ============================================
@@ -2414,6 +4552,13 @@ class CorporateQuoteRequest(BaseModel):
     selectedPlan: Optional[str] = None
     source: str = "corporate_website"
 
+# Corporate plans and their price per employee
+CORPORATE_PLAN_PRICES = {
+    'starter': 15,
+    'business': 12,
+    'enterprise': 8
+}
+
 class CorporateCheckoutRequest(BaseModel):
     company: str
     name: str
@@ -2493,17 +4638,10 @@ async def get_corporate_quotes(
 async def create_corporate_checkout(request: CorporateCheckoutRequest):
     """Create Stripe checkout session for corporate license purchase"""
     try:
-        # Define plan pricing
-        plan_prices = {
-            'starter': 15,
-            'business': 12, 
-            'enterprise': 8
-        }
-        
-        if request.plan not in plan_prices:
+        if request.plan not in CORPORATE_PLAN_PRICES:
             raise HTTPException(status_code=400, detail="Plano inválido")
         
-        price_per_employee = plan_prices[request.plan]
+        price_per_employee = CORPORATE_PLAN_PRICES[request.plan]
         total_amount = price_per_employee * request.employees
         
         # Initialize Stripe checkout
@@ -2572,6 +4710,228 @@ async def create_corporate_checkout(request: CorporateCheckoutRequest):
         logger.error(f"Error creating corporate checkout: {e}")
         raise HTTPException(status_code=500, detail="Erro ao criar checkout corporativo")
 
+# ============================================
+# CORPORATE EMPLOYEE PROVISIONING (admin)
+# ============================================
+
+class EmployeeRow(BaseModel):
+    name: str
+    email: EmailStr
+    
+    @validator('name')
+    def name_must_not_be_empty(cls, v):
+        if len(v.strip()) < 2:
+            raise ValueError('Nome deve ter pelo menos 2 caracteres')
+        return v.strip()
+    
+    @validator('email')
+    def normalize_email(cls, v):
+        return v.lower()
+
+async def spool_request_body(request: Request):
+    """Read the request body into a temporary file before the response starts.
+
+    A StreamingResponse listens for client disconnects on the same receive
+    channel and drops body messages, so uploads must be fully read in the
+    handler; only the results are streamed.
+    """
+    body = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_MAX_MEMORY)
+    try:
+        async for chunk in request.stream():
+            body.write(chunk)
+    except BaseException:
+        body.close()
+        raise
+    body.seek(0)
+    return body
+
+def iter_body_lines(body):
+    """Yield decoded lines from a spooled body without loading it whole"""
+    pending = b""
+    while True:
+        chunk = body.read(UPLOAD_READ_CHUNK_SIZE)
+        if not chunk:
+            break
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8-sig").rstrip("\r")
+    if pending:
+        yield pending.decode("utf-8-sig").rstrip("\r")
+
+def iter_upload_rows(body, input_format: str):
+    """Yield (row_number, raw dict or None, error) tuples from a spooled CSV or NDJSON body"""
+    header = None
+    row_number = 0
+    partial = None
+    for line in iter_body_lines(body):
+        if input_format == "csv":
+            # A quoted CSV field may contain newlines; join lines until the quotes balance
+            if partial is not None:
+                line = f"{partial}\n{line}"
+                partial = None
+            if line.count('"') % 2:
+                partial = line
+                continue
+        if not line.strip():
+            continue
+        if input_format == "csv":
+            values = next(csv.reader([line]))
+            if header is None:
+                header = [column.strip().lower() for column in values]
+                continue
+            row_number += 1
+            yield row_number, dict(zip(header, values)), None
+        else:
+            row_number += 1
+            try:
+                yield row_number, json.loads(line), None
+            except json.JSONDecodeError as e:
+                yield row_number, None, f"JSON inválido: {e.msg}"
+    if partial is not None:
+        yield row_number + 1, None, "CSV inválido: aspas não fechadas"
+
+async def provision_employee_chunk(rows: List[tuple], company: str, plan: str, duration_months: int) -> List[dict]:
+    """Create users and active subscriptions for a chunk of validated rows in a few round trips"""
+    emails = [row.email for _, row in rows]
+    existing = {
+        user["email"]
+        async for user in db.users.find({"email": {"$in": emails}}, {"email": 1, "_id": 0})
+    }
+    
+    now = datetime.utcnow()
+    results = []
+    documents = []
+    secrets_by_email = {}
+    for row_number, row in rows:
+        if row.email in existing:
+            results.append({"row": row_number, "email": row.email, "status": "exists"})
+            continue
+        
+        # Invite secrets are random and high-entropy, so SHA-256 (not bcrypt) is enough
+        invite_secret = secrets.token_urlsafe(16)
+        secrets_by_email[row.email] = (row_number, invite_secret)
+        documents.append({
+            "_id": ObjectId(),
+            "id": str(uuid.uuid4()),
+            "name": row.name,
+            "email": row.email,
+            "invite_secret_hash": hash_refresh_token(invite_secret),
+            "company": company,
+            "created_at": now
+        })
+    
+    failed_emails = set()
+    if documents:
+        try:
+            await db.users.insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            # Rows raced with a concurrent registration; report them, keep the rest
+            for error in e.details.get("writeErrors", []):
+                failed_emails.add(documents[error["index"]]["email"])
+    
+    created = [doc for doc in documents if doc["email"] not in failed_emails]
+    if created:
+        end_date = now + timedelta(days=30 * duration_months)
+        await db.user_subscriptions.bulk_write([
+            UpdateOne(
+                {"user_id": str(doc["_id"])},
+                {"$setOnInsert": {
+                    "user_id": str(doc["_id"]),
+                    "plan_id": f"corporate_{plan}",
+                    "status": "active",
+                    "start_date": now,
+                    "end_date": end_date,
+                    "created_at": now,
+                    "updated_at": now
+                }},
+                upsert=True
+            )
+            for doc in created
+        ], ordered=False)
+    
+    for doc in documents:
+        row_number, invite_secret = secrets_by_email[doc["email"]]
+        if doc["email"] in failed_emails:
+            results.append({"row": row_number, "email": doc["email"], "status": "exists"})
+        else:
+            results.append({
+                "row": row_number,
+                "email": doc["email"],
+                "status": "created",
+                "user_id": str(doc["_id"]),
+                "invite_secret": invite_secret
+            })
+    
+    return sorted(results, key=lambda result: result["row"])
+
+@api_router.post("/corporate/employees/bulk", dependencies=[Depends(require_admin)])
+async def bulk_provision_employees(
+    request: Request,
+    company: str,
+    plan: str = "business",
+    duration_months: int = 12,
+    format: str = "csv"
+):
+    """Provision employee accounts from a CSV (name,email header) or NDJSON body.
+
+    Streams NDJSON back: one result per input row, a progress line per chunk
+    and a final summary. Invite secrets are returned once and never stored
+    in clear text; employees redeem them at /api/invite/accept.
+    """
+    if format not in ("csv", "ndjson"):
+        raise HTTPException(status_code=400, detail="Formato deve ser csv ou ndjson")
+    if plan not in CORPORATE_PLAN_PRICES:
+        raise HTTPException(status_code=400, detail="Plano inválido")
+    if duration_months < 1:
+        raise HTTPException(status_code=400, detail="Duração deve ser de pelo menos 1 mês")
+    
+    body = await spool_request_body(request)
+    
+    async def provision():
+        try:
+            summary = {"created": 0, "exists": 0, "invalid": 0}
+            seen = set()
+            chunk = []
+            processed = 0
+            
+            for row_number, raw, error in iter_upload_rows(body, format):
+                if error is None:
+                    try:
+                        row = EmployeeRow(**raw)
+                        if row.email in seen:
+                            error = "Email duplicado no arquivo"
+                    except Exception as e:
+                        error = str(e)
+                
+                if error is not None:
+                    summary["invalid"] += 1
+                    yield json.dumps({"row": row_number, "status": "invalid", "error": error}) + "\n"
+                    continue
+                
+                seen.add(row.email)
+                chunk.append((row_number, row))
+                if len(chunk) >= PROVISIONING_CHUNK_SIZE:
+                    for result in await provision_employee_chunk(chunk, company, plan, duration_months):
+                        summary[result["status"]] += 1
+                        yield json.dumps(result) + "\n"
+                    processed += len(chunk)
+                    chunk = []
+                    yield json.dumps({"type": "progress", "processed": processed}) + "\n"
+            
+            if chunk:
+                for result in await provision_employee_chunk(chunk, company, plan, duration_months):
+                    summary[result["status"]] += 1
+                    yield json.dumps(result) + "\n"
+                processed += len(chunk)
+            
+            logger.info(f"Bulk provisioning for {company}: {summary}")
+            yield json.dumps({"type": "summary", "processed": processed, **summary}) + "\n"
+        finally:
+            body.close()
+    
+    return StreamingResponse(provision(), media_type="application/x-ndjson")
+
 # Include the router in the main app (MUST be after all endpoint definitions)
 app.include_router(api_router)
 
@@ -2584,4 +4944,5 @@ logger = logging.getLogger(__name__)
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    client.close()
+    password_hash_pool.shutdown()
\ No newline at end of file
@@ -0,0 +1,165 @@
+"""Pluggable JWT backends for access tokens.
+
+Both python-jose and PyJWT are supported, with HS256 (shared secret) or
+EdDSA (Ed25519 key pair; PyJWT only). Key material is parsed once when the
+backend is built, so encode/decode on the request path only sign and verify.
+
+Run ``python token_backend.py`` to benchmark every available combination.
+"""
+import argparse
+import secrets
+import statistics
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+import jwt as pyjwt
+from jose import JWTError, jwt as jose_jwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+
+LIBRARIES = ("pyjwt", "jose")
+ALGORITHMS = ("HS256", "EdDSA")
+
+
+class TokenError(Exception):
+    """Raised when a token cannot be decoded or verified, whatever the library"""
+
+
+def generate_ed25519_keypair() -> tuple:
+    """Return a new (private_pem, public_pem) Ed25519 key pair"""
+    private_key = Ed25519PrivateKey.generate()
+    private_pem = private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption()
+    ).decode('utf-8')
+    public_pem = private_key.public_key().public_bytes(
+        serialization.Encoding.PEM,
+        serialization.PublicFormat.SubjectPublicKeyInfo
+    ).decode('utf-8')
+    return private_pem, public_pem
+
+
+class TokenBackend:
+    """Encode and decode JWTs with a fixed library, algorithm and pre-parsed keys"""
+
+    def __init__(
+        self,
+        library: str = "pyjwt",
+        algorithm: str = "HS256",
+        secret_key: Optional[str] = None,
+        private_key_pem: Optional[str] = None,
+        public_key_pem: Optional[str] = None
+    ):
+        if library not in LIBRARIES:
+            raise ValueError(f"Unknown JWT library: {library}")
+        if algorithm not in ALGORITHMS:
+            raise ValueError(f"Unknown JWT algorithm: {algorithm}")
+        if library == "jose" and algorithm == "EdDSA":
+            raise ValueError("python-jose does not support EdDSA; use the pyjwt library")
+
+        self.library = library
+        self.algorithm = algorithm
+
+        if algorithm == "HS256":
+            if not secret_key:
+                raise ValueError("HS256 requires a secret key")
+            self._signing_key = secret_key.encode('utf-8') if library == "pyjwt" else secret_key
+            self._verification_key = self._signing_key
+        else:
+            if not private_key_pem or not public_key_pem:
+                raise ValueError("EdDSA requires a private and a public key")
+            self._signing_key = serialization.load_pem_private_key(private_key_pem.encode('utf-8'), password=None)
+            self._verification_key = serialization.load_pem_public_key(public_key_pem.encode('utf-8'))
+
+    @property
+    def name(self) -> str:
+        return f"{self.library}/{self.algorithm}"
+
+    def encode(self, payload: dict) -> str:
+        if self.library == "pyjwt":
+            return pyjwt.encode(payload, self._signing_key, algorithm=self.algorithm)
+        return jose_jwt.encode(payload, self._signing_key, algorithm=self.algorithm)
+
+    def decode(self, token: str) -> dict:
+        try:
+            if self.library == "pyjwt":
+                return pyjwt.decode(token, self._verification_key, algorithms=[self.algorithm])
+            return jose_jwt.decode(token, self._verification_key, algorithms=[self.algorithm])
+        except (pyjwt.PyJWTError, JWTError) as e:
+            raise TokenError(str(e)) from e
+
+
+def _measure(func, arg, iterations: int) -> dict:
+    latencies = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        func(arg)
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    return {
+        "ops_per_second": round(iterations / sum(latencies)),
+        "p50_us": round(statistics.median(latencies) * 1e6, 1),
+        "p99_us": round(latencies[int(len(latencies) * 0.99) - 1] * 1e6, 1)
+    }
+
+
+def benchmark(iterations: int = 5000) -> list:
+    """Measure encode/decode throughput and latency for every supported combination"""
+    secret_key = secrets.token_urlsafe(32)
+    private_pem, public_pem = generate_ed25519_keypair()
+    payload = {
+        "sub": "benchmark@example.com",
+        "uid": "65f000000000000000000000",
+        "name": "Benchmark",
+        "pv": 0,
+        "jti": secrets.token_hex(16),
+        "exp": datetime.utcnow() + timedelta(hours=1)
+    }
+
+    results = []
+    for library in LIBRARIES:
+        for algorithm in ALGORITHMS:
+            try:
+                backend = TokenBackend(library, algorithm, secret_key, private_pem, public_pem)
+            except ValueError as e:
+                results.append({"backend": f"{library}/{algorithm}", "skipped": str(e)})
+                continue
+
+            token = backend.encode(payload)
+            # Warm up caches before timing
+            for _ in range(min(100, iterations)):
+                backend.decode(token)
+            results.append({
+                "backend": backend.name,
+                "encode": _measure(backend.encode, payload, iterations),
+                "decode": _measure(backend.decode, token, iterations)
+            })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark JWT encode/decode backends")
+    parser.add_argument("--iterations", type=int, default=5000)
+    args = parser.parse_args()
+
+    results = benchmark(args.iterations)
+    print(f"{'backend':<14} {'encode ops/s':>13} {'p50 us':>8} {'p99 us':>8} {'decode ops/s':>13} {'p50 us':>8} {'p99 us':>8}")
+    for result in results:
+        if "skipped" in result:
+            print(f"{result['backend']:<14} skipped: {result['skipped']}")
+            continue
+        encode, decode = result["encode"], result["decode"]
+        print(
+            f"{result['backend']:<14} {encode['ops_per_second']:>13} {encode['p50_us']:>8} {encode['p99_us']:>8} "
+            f"{decode['ops_per_second']:>13} {decode['p50_us']:>8} {decode['p99_us']:>8}"
+        )
+
+    measured = [result for result in results if "skipped" not in result]
+    fastest = max(measured, key=lambda result: result["decode"]["ops_per_second"])
+    print(f"\nFastest decode: {fastest['backend']}")
+
+
+if __name__ == "__main__":
+    main()
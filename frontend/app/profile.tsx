@@ -298,7 +298,7 @@ export default function ProfileScreen() {
             <View style={styles.avatar}>
               {user?.profile_photo ? (
                 <Image 
-                  source={{ uri: user.profile_photo }} 
+                  source={{ uri: user.profile_photo.startsWith('/') ? `${API_BASE_URL}${user.profile_photo}` : user.profile_photo }} 
                   style={styles.profileImage}
                 />
               ) : (
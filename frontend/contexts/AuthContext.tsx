@@ -80,6 +80,74 @@ api.interceptors.response.use(
   }
 );
 
+async function getStoredItem(key: string): Promise<string | null> {
+  if (Platform.OS === 'web') {
+    return localStorage.getItem(key);
+  }
+  return await AsyncStorage.getItem(key);
+}
+
+async function setStoredItem(key: string, value: string) {
+  if (Platform.OS === 'web') {
+    localStorage.setItem(key, value);
+  } else {
+    await AsyncStorage.setItem(key, value);
+  }
+}
+
+// Renew expired access tokens with the refresh token instead of sending the user back to login
+let refreshPromise: Promise<string | null> | null = null;
+
+async function refreshAccessToken(): Promise<string | null> {
+  try {
+    const refreshToken = await getStoredItem('@refreshToken');
+    if (!refreshToken) {
+      return null;
+    }
+
+    const response = await axios.post(`${API_BASE_URL}/api/token/refresh`, {
+      refresh_token: refreshToken,
+    });
+    const { access_token, refresh_token } = response.data;
+
+    await setStoredItem('@token', access_token);
+    await setStoredItem('@refreshToken', refresh_token);
+    api.defaults.headers.authorization = `Bearer ${access_token}`;
+    console.log('🔄 Access token refreshed');
+    return access_token;
+  } catch (error) {
+    console.log('🔄 Token refresh failed:', error);
+    return null;
+  }
+}
+
+api.interceptors.response.use(
+  (response) => response,
+  async (error) => {
+    const originalRequest = error.config;
+    const isAuthRequest = originalRequest?.url?.includes('/api/login') || originalRequest?.url?.includes('/api/token/refresh');
+
+    if (error.response?.status === 401 && originalRequest && !originalRequest._retry && !isAuthRequest) {
+      originalRequest._retry = true;
+
+      // Share a single refresh between all requests that failed at the same time
+      if (!refreshPromise) {
+        refreshPromise = refreshAccessToken().finally(() => {
+          refreshPromise = null;
+        });
+      }
+
+      const newToken = await refreshPromise;
+      if (newToken) {
+        originalRequest.headers.authorization = `Bearer ${newToken}`;
+        return api(originalRequest);
+      }
+    }
+
+    return Promise.reject(error);
+  }
+);
+
 export function AuthProvider({ children }: { children: React.ReactNode }) {
   const [user, setUser] = useState<User | null>(null);
   const [loading, setLoading] = useState(true);
@@ -183,7 +251,7 @@ export function AuthProvider({ children }: { children: React.ReactNode }) {
       });
 
       console.log('✅ Login response received');
-      const { access_token, user: userData } = response.data;
+      const { access_token, refresh_token, user: userData } = response.data;
 
       // Set API authorization header immediately
       api.defaults.headers.authorization = `Bearer ${access_token}`;
@@ -196,10 +264,12 @@ export function AuthProvider({ children }: { children: React.ReactNode }) {
       try {
         if (Platform.OS === 'web') {
           localStorage.setItem('@token', access_token);
+          localStorage.setItem('@refreshToken', refresh_token);
           localStorage.setItem('@user', JSON.stringify(userData));
           console.log('✅ Stored in localStorage');
         } else {
           await AsyncStorage.setItem('@token', access_token);
+          await AsyncStorage.setItem('@refreshToken', refresh_token);
           await AsyncStorage.setItem('@user', JSON.stringify(userData));
           console.log('✅ Stored in AsyncStorage');
         }
@@ -237,19 +307,23 @@ export function AuthProvider({ children }: { children: React.ReactNode }) {
         email: email.toLowerCase().trim(),
         password,
         confirm_password: confirmPassword,
+        // Decides when the user's day starts for mood, gratitude and missions
+        timezone: Intl.DateTimeFormat().resolvedOptions().timeZone,
       });
 
       console.log('✅ Registration response:', response.data);
-      const { access_token, user: userData } = response.data;
+      const { access_token, refresh_token, user: userData } = response.data;
 
       // Store credentials with platform-specific approach
       try {
         await AsyncStorage.setItem('@token', access_token);
+        await AsyncStorage.setItem('@refreshToken', refresh_token);
         await AsyncStorage.setItem('@user', JSON.stringify(userData));
       } catch (storageError) {
         console.log('AsyncStorage error, trying web storage:', storageError);
         if (Platform.OS === 'web') {
           localStorage.setItem('@token', access_token);
+          localStorage.setItem('@refreshToken', refresh_token);
           localStorage.setItem('@user', JSON.stringify(userData));
         }
       }
@@ -287,8 +361,20 @@ export function AuthProvider({ children }: { children: React.ReactNode }) {
   }
 
   async function signOut() {
+    // Revoke the session on the server before forgetting its tokens
+    try {
+      const refreshToken = await getStoredItem('@refreshToken');
+      await api.post('/api/logout', { refresh_token: refreshToken });
+    } catch (error) {
+      console.log('🚪 Logout request failed:', error);
+    }
+
     await AsyncStorage.removeItem('@token');
+    await AsyncStorage.removeItem('@refreshToken');
     await AsyncStorage.removeItem('@user');
+    if (Platform.OS === 'web') {
+      localStorage.removeItem('@refreshToken');
+    }
     delete api.defaults.headers.authorization;
     
     // Disable notifications when signing out
@@ -0,0 +1,8 @@
+"""Make backend/server.py importable without a running MongoDB or real credentials"""
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("STRIPE_API_KEY", "sk_test_placeholder")
@@ -0,0 +1,150 @@
+"""In-memory stand-ins for the Motor collections used by server.py.
+
+Only the query and update operators the code under test uses are supported.
+Every call is recorded as (method, filter) so tests can assert on the
+queries a request makes, not just how many.
+"""
+import copy
+
+
+def _get(document, path):
+    for part in path.split("."):
+        if not isinstance(document, dict):
+            return None
+        document = document.get(part)
+    return document
+
+
+def _set(document, path, value):
+    *parents, last = path.split(".")
+    for part in parents:
+        document = document.setdefault(part, {})
+    document[last] = value
+
+
+OPERATORS = {
+    "$gt": lambda value, arg: value is not None and value > arg,
+    "$gte": lambda value, arg: value is not None and value >= arg,
+    "$lt": lambda value, arg: value is not None and value < arg,
+    "$lte": lambda value, arg: value is not None and value <= arg,
+    "$ne": lambda value, arg: value != arg,
+    "$in": lambda value, arg: value in arg,
+    "$exists": lambda value, arg: (value is not None) == arg,
+}
+
+
+def matches(document, query):
+    for key, condition in (query or {}).items():
+        if key == "$or":
+            if not any(matches(document, branch) for branch in condition):
+                return False
+            continue
+        value = _get(document, key)
+        if isinstance(condition, dict) and condition and all(op.startswith("$") for op in condition):
+            if not all(OPERATORS[op](value, arg) for op, arg in condition.items()):
+                return False
+        elif isinstance(value, list):
+            if condition not in value:
+                return False
+        elif value != condition:
+            return False
+    return True
+
+
+def apply_update(document, update, inserting):
+    for path, value in update.get("$set", {}).items():
+        _set(document, path, value)
+    for path, value in update.get("$inc", {}).items():
+        _set(document, path, (_get(document, path) or 0) + value)
+    if inserting:
+        for path, value in update.get("$setOnInsert", {}).items():
+            _set(document, path, value)
+
+
+class FakeCursor:
+    def __init__(self, documents):
+        self._documents = [copy.deepcopy(document) for document in documents]
+
+    def sort(self, key, direction=None):
+        keys = [(key, direction)] if isinstance(key, str) else list(key)
+        for field, field_direction in reversed(keys):
+            self._documents.sort(key=lambda document: _get(document, field), reverse=field_direction == -1)
+        return self
+
+    def limit(self, count):
+        if count:
+            self._documents = self._documents[:count]
+        return self
+
+    async def to_list(self, length=None):
+        return self._documents[:length] if length else list(self._documents)
+
+    def __aiter__(self):
+        self._iterator = iter(self._documents)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iterator)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class FakeCollection:
+    def __init__(self, documents=()):
+        self.documents = [copy.deepcopy(document) for document in documents]
+        self.calls = []
+
+    def _matching(self, query):
+        return [document for document in self.documents if matches(document, query)]
+
+    def find(self, query=None, projection=None):
+        self.calls.append(("find", query))
+        return FakeCursor(self._matching(query))
+
+    async def find_one(self, query=None, projection=None):
+        self.calls.append(("find_one", query))
+        found = self._matching(query)
+        return copy.deepcopy(found[0]) if found else None
+
+    async def insert_one(self, document):
+        self.calls.append(("insert_one", document))
+        self.documents.append(copy.deepcopy(document))
+
+    async def update_one(self, query, update, upsert=False):
+        self.calls.append(("update_one", query))
+        self._update(query, update, upsert)
+
+    async def find_one_and_update(self, query, update, upsert=False, projection=None, **kwargs):
+        self.calls.append(("find_one_and_update", query))
+        return copy.deepcopy(self._update(query, update, upsert))
+
+    async def bulk_write(self, operations, ordered=True):
+        for operation in operations:
+            self.calls.append(("bulk_write", operation._filter))
+            self._update(operation._filter, operation._doc, operation._upsert)
+
+    def _update(self, query, update, upsert):
+        found = self._matching(query)
+        if found:
+            apply_update(found[0], update, inserting=False)
+            return found[0]
+        if not upsert:
+            return None
+        document = {key: value for key, value in query.items() if not isinstance(value, dict)}
+        apply_update(document, update, inserting=True)
+        self.documents.append(document)
+        return document
+
+
+class FakeDb:
+    def __init__(self, **collections):
+        self.collections = {name: FakeCollection(documents) for name, documents in collections.items()}
+
+    def __getattr__(self, name):
+        if name.startswith("_") or name == "collections":
+            raise AttributeError(name)
+        return self.collections.setdefault(name, FakeCollection())
+
+    def __getitem__(self, name):
+        return getattr(self, name)
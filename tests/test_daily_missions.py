@@ -0,0 +1,95 @@
+"""Queries made by get_daily_missions_for_user, against an in-memory fake db (no MongoDB needed)"""
+import asyncio
+
+import server
+from tests.fakes import FakeDb
+
+DAY_KEY = "2024-05-10"
+DAY_QUERY = {"user_id": "user-1", "day_key": DAY_KEY}
+
+
+def make_mission(mission_id: str, category: str, min_level: int = 1) -> dict:
+    return {
+        "id": mission_id,
+        "title": mission_id,
+        "description": mission_id,
+        "category": category,
+        "difficulty": "easy",
+        "xp_reward": 10,
+        "min_level": min_level,
+        "icon": "star",
+        "tips": [],
+        "estimated_minutes": 5,
+    }
+
+
+CATALOG = server.MissionCatalog(
+    [
+        make_mission("breathe", "mindfulness"),
+        make_mission("thanks", "gratitude"),
+        make_mission("walk", "movement"),
+        make_mission("call", "social"),
+        make_mission("paint", "creativity", min_level=3),
+        make_mission("hike", "nature", min_level=3),
+    ],
+    "test",
+)
+
+
+def use_fake_db(monkeypatch, **collections) -> FakeDb:
+    fake_db = FakeDb(**collections)
+    monkeypatch.setattr(server, "db", fake_db)
+    monkeypatch.setattr(server, "mission_catalog", CATALOG)
+    return fake_db
+
+
+def test_stored_set_is_one_read_plus_one_progress_query(monkeypatch):
+    fake_db = use_fake_db(
+        monkeypatch,
+        daily_mission_sets=[{**DAY_QUERY, "missions": ["breathe", "thanks", "walk"]}],
+        user_mission_progress=[
+            {"_id": "p1", **DAY_QUERY, "mission_id": "thanks", "completed": True},
+            {"_id": "p2", "user_id": "user-1", "day_key": "2024-05-09", "mission_id": "walk", "completed": True},
+        ],
+    )
+
+    result = asyncio.run(server.get_daily_missions_for_user("user-1", 1, DAY_KEY))
+
+    assert [mission["id"] for mission in result] == ["breathe", "thanks", "walk"]
+    assert [mission["completed"] for mission in result] == [False, True, False]
+    # A read keyed on (user_id, day_key) for the set, one query for the progress of all its missions
+    assert fake_db.daily_mission_sets.calls == [("find_one", DAY_QUERY)]
+    assert fake_db.user_mission_progress.calls == [("find", DAY_QUERY)]
+    assert set(fake_db.collections) == {"daily_mission_sets", "user_mission_progress"}
+
+
+def test_first_view_stores_the_set_and_later_views_only_read(monkeypatch):
+    fake_db = use_fake_db(monkeypatch)
+
+    first = asyncio.run(server.get_daily_missions_for_user("user-1", 1, DAY_KEY))
+    assert [call[0] for call in fake_db.daily_mission_sets.calls] == ["find_one", "find_one_and_update"]
+    assert fake_db.daily_mission_sets.documents[0]["catalog_version"] == "test"
+
+    # Levelling up later that day unlocks more missions but does not reshuffle the set
+    fake_db.daily_mission_sets.calls.clear()
+    later = asyncio.run(server.get_daily_missions_for_user("user-1", 5, DAY_KEY))
+    assert [mission["id"] for mission in later] == [mission["id"] for mission in first]
+    assert fake_db.daily_mission_sets.calls == [("find_one", DAY_QUERY)]
+
+
+def test_selection_is_deterministic_per_user_and_day():
+    catalog = server.MissionCatalog(
+        [make_mission(f"m{index}", category) for index, category in enumerate(
+            ["mindfulness", "gratitude", "movement", "social", "selfcare", "nature"] * 2
+        )],
+        "test",
+    )
+
+    def pick(user_id, day_key):
+        rng = server.mission_selection_rng(user_id, day_key, catalog.version)
+        return [mission["id"] for mission in server.select_daily_missions(catalog, 1, rng)]
+
+    assert pick("user-1", DAY_KEY) == pick("user-1", DAY_KEY)
+    assert len(set(pick("user-1", DAY_KEY))) == 3
+    # Different days give different sets (for this seed)
+    assert len({tuple(pick("user-1", f"2024-05-{day:02d}")) for day in range(1, 11)}) > 1
@@ -0,0 +1,56 @@
+"""Week/month mood rollups kept up to date on every write"""
+import asyncio
+
+import server
+from tests.fakes import FakeDb
+
+DAY_KEY = "2024-05-10"
+
+
+def rollup(fake_db: FakeDb, period: str) -> dict:
+    key = server.mood_rollup_keys(server.day_from_key(DAY_KEY))[period]
+    found = [document for document in fake_db.mood_rollups.documents if document["period"] == period and document["key"] == key]
+    assert len(found) == 1
+    return found[0]
+
+
+def test_replacing_a_logged_day_moves_its_level(monkeypatch):
+    fake_db = FakeDb()
+    monkeypatch.setattr(server, "db", fake_db)
+
+    asyncio.run(server.update_mood_rollups("user-1", DAY_KEY, 4))
+    asyncio.run(server.update_mood_rollups("user-1", DAY_KEY, 2, previous_level=4))
+
+    for period in server.MOOD_ROLLUP_PERIODS:
+        summary = server.mood_rollup_summary(rollup(fake_db, period))
+        assert summary["count"] == 1
+        assert summary["average"] == 2
+        assert summary["variance"] == 0
+        assert summary["min"] == summary["max"] == 2
+        assert summary["histogram"] == {"1": 0, "2": 1, "3": 0, "4": 0, "5": 0}
+
+
+def test_rewriting_the_same_level_changes_nothing(monkeypatch):
+    fake_db = FakeDb()
+    monkeypatch.setattr(server, "db", fake_db)
+
+    asyncio.run(server.update_mood_rollups("user-1", DAY_KEY, 3))
+    asyncio.run(server.update_mood_rollups("user-1", DAY_KEY, 3, previous_level=3))
+
+    assert rollup(fake_db, "month")["count"] == 1
+    assert len(fake_db.mood_rollups.calls) == len(server.MOOD_ROLLUP_PERIODS)
+
+
+def test_incremental_rollups_match_a_full_rebuild(monkeypatch):
+    fake_db = FakeDb()
+    monkeypatch.setattr(server, "db", fake_db)
+
+    entries = []
+    for day, level, previous in [("2024-05-10", 4, None), ("2024-05-11", 1, None), ("2024-05-10", 5, 4)]:
+        asyncio.run(server.update_mood_rollups("user-1", day, level, previous))
+        entries = [entry for entry in entries if entry["day_key"] != day] + [{"day_key": day, "mood_level": level}]
+
+    rebuilt = {(doc["period"], doc["key"]): doc for doc in server.build_mood_rollups("user-1", entries)}
+    for document in fake_db.mood_rollups.documents:
+        expected = rebuilt[(document["period"], document["key"])]
+        assert server.mood_rollup_summary(document) == server.mood_rollup_summary(expected)
@@ -0,0 +1,78 @@
+"""Delta sync cursor: in-flight reservations and per-collection paging"""
+import asyncio
+from datetime import datetime, timedelta
+
+import server
+from tests.fakes import FakeDb
+
+
+def mood(version: int) -> dict:
+    return {
+        "user_id": "user-1",
+        "id": f"mood-{version}",
+        "mood_level": 3,
+        "mood_emoji": server.MOOD_EMOJIS[2],
+        "date": datetime(2024, 5, version),
+        "sync_version": version,
+    }
+
+
+def counter(version: int, *reservations) -> dict:
+    return {"user_id": "user-1", "version": version, "reservations": list(reservations)}
+
+
+def reserved(first: int, seconds_ago: float) -> dict:
+    return {"first": first, "at": datetime.utcnow() - timedelta(seconds=seconds_ago)}
+
+
+def pull(monkeypatch, since: int, **collections) -> dict:
+    monkeypatch.setattr(server, "MOOD_STORAGE_MODE", "documents")
+    monkeypatch.setattr(server, "db", FakeDb(**collections))
+    return asyncio.run(server.collect_sync_changes("user-1", since))
+
+
+def test_settled_version_stops_before_recent_reservations():
+    assert server.settled_sync_version(None) == 0
+    assert server.settled_sync_version(counter(9)) == 9
+    # Old reservations are assumed written; recent ones hold the cursor before their first version
+    assert server.settled_sync_version(counter(9, reserved(3, 3600), reserved(7, 1), reserved(9, 0))) == 6
+
+
+def test_pull_does_not_skip_a_write_still_in_flight(monkeypatch):
+    # Version 5 is reserved but its document is not written yet; 6 already is
+    moods = [mood(1), mood(2), mood(3), mood(4), mood(6)]
+    result = pull(monkeypatch, 0, sync_versions=[counter(6, reserved(5, 1), reserved(6, 0.5))], humor_diario=moods)
+
+    assert result["version"] == 4
+    assert result["has_more"] is False
+
+    # Once version 5 lands the next pull from 4 delivers it (and 6 again)
+    moods.append(mood(5))
+    result = pull(monkeypatch, 4, sync_versions=[counter(6, reserved(5, 3600), reserved(6, 3600))], humor_diario=moods)
+    assert [entry["sync_version"] for entry in result["changes"]["mood"]] == [5, 6]
+    assert result["version"] == 6
+
+
+def test_pull_pages_stop_at_the_last_fully_delivered_version(monkeypatch):
+    monkeypatch.setattr(server, "SYNC_PAGE_SIZE", 2)
+    collections = {
+        "sync_versions": [counter(5)],
+        "humor_diario": [mood(1), mood(2), mood(4), mood(5)],
+        "gratitude_entries": [{"user_id": "user-1", "id": "g3", "sync_version": 3}],
+    }
+
+    first = pull(monkeypatch, 0, **collections)
+    assert [entry["sync_version"] for entry in first["changes"]["mood"]] == [1, 2]
+    assert [entry["id"] for entry in first["changes"]["gratitude"]] == ["g3"]
+    assert first["version"] == 2
+    assert first["has_more"] is True
+
+    second = pull(monkeypatch, first["version"], **collections)
+    assert [entry["sync_version"] for entry in second["changes"]["mood"]] == [4, 5]
+    assert second["version"] == 5
+    assert second["has_more"] is False
+
+
+def test_pull_never_moves_the_client_backwards(monkeypatch):
+    result = pull(monkeypatch, 8, sync_versions=[counter(9, reserved(7, 0))])
+    assert result["version"] == 8
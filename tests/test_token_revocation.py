@@ -0,0 +1,72 @@
+"""Bloom filter of revoked token ids: refreshes never expose a partial filter"""
+import asyncio
+from datetime import datetime, timedelta
+
+import server
+from tests.fakes import FakeCollection, FakeCursor, FakeDb
+
+
+class ObservedCursor(FakeCursor):
+    """Runs a check before handing out each document"""
+
+    def __init__(self, documents, check):
+        super().__init__(documents)
+        self._check = check
+
+    async def __anext__(self):
+        self._check()
+        return await super().__anext__()
+
+
+def revoked(jti: str) -> dict:
+    return {"jti": jti, "expires_at": datetime.utcnow() + timedelta(hours=1)}
+
+
+def test_lookups_use_the_previous_filter_until_the_refresh_completes(monkeypatch):
+    revocations = server.TokenRevocationList(size_bits=1 << 12)
+    revocations.add("old")
+
+    during_refresh = []
+    collection = FakeCollection([revoked("old"), revoked("new")])
+
+    def find(query=None, projection=None):
+        # Revoked on this worker while the cursor streams: must survive the swap
+        revocations.add("local")
+        return ObservedCursor(
+            collection._matching(query),
+            lambda: during_refresh.append(revocations.might_contain("old"))
+        )
+
+    collection.find = find
+    fake_db = FakeDb()
+    fake_db.collections["revoked_tokens"] = collection
+    monkeypatch.setattr(server, "db", fake_db)
+
+    asyncio.run(revocations.refresh())
+
+    assert during_refresh and all(during_refresh)
+    assert revocations.might_contain("old")
+    assert revocations.might_contain("new")
+    assert revocations.might_contain("local")
+    assert revocations.count == 3
+
+
+def test_a_failed_refresh_keeps_the_previous_filter(monkeypatch):
+    revocations = server.TokenRevocationList(size_bits=1 << 12)
+    revocations.add("old")
+
+    def failing_find(query=None, projection=None):
+        raise RuntimeError("connection lost")
+
+    fake_db = FakeDb()
+    fake_db.collections["revoked_tokens"] = FakeCollection()
+    fake_db.collections["revoked_tokens"].find = failing_find
+    monkeypatch.setattr(server, "db", fake_db)
+
+    try:
+        asyncio.run(revocations.refresh())
+    except RuntimeError:
+        pass
+
+    assert revocations.might_contain("old")
+    assert revocations._added_during_refresh is None